@@ -1,7 +1,12 @@
+import argparse
 import cv2
 import face_recognition
 import os
 import csv
+import hashlib
+import json
+import platform
+import sqlite3
 from datetime import datetime
 import numpy as np
 import time
@@ -9,25 +14,80 @@ import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
 import threading
+import queue
+import multiprocessing
+import atexit
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import deque, namedtuple
+
+# Worker processes are spawned, not forked: forking copies a process full of
+# threads (Tk, capture, log and snapshot writers) and can deadlock the child
+SPAWN = multiprocessing.get_context("spawn")
 
 
 class FacialRecognitionGUI:
-    def __init__(self, master):
+    def __init__(self, master, sources=None, workers=None, system_options=None, watch_interval=5.0,
+                 target_fps=10.0, motion_gating=True, roi=None, render_fps=30.0, stats_interval=0,
+                 stats_format="csv"):
         self.master = master
         self.master.title("Facial Recognition System")
         self.master.geometry("1200x700")
         self.master.configure(bg="#f0f0f0")
         self.master.resizable(True, True)
 
-        # Create the recognition system in the background
-        self.system = FacialRecognitionSystem(reset_logs=False)
+        # Create the recognition system; known faces are enrolled in the background
+        self.system = FacialRecognitionSystem(reset_logs=False, load_faces=False, **(system_options or {}))
+
+        # Video sources; with several cameras detection/encoding runs on a shared process pool
+        self.sources = sources or [0]
+        if workers is None:
+            workers = os.cpu_count() if len(self.sources) > 1 else 0
+        self.workers = workers
+        self.executor = None
+        self.target_fps = target_fps
+        self.motion_gating = motion_gating
+        self.roi = roi
+
+        # Worker threads never touch Tk: they post ("event", message) and other updates
+        # to this queue, and poll_updates() applies them from the Tk main loop
+        self.updates = queue.Queue()
+        self.render_interval = 1.0 / render_fps if render_fps else 0
+        self.last_panel_update = 0
+
+        # Known faces are watched for changes once the first enrollment is done
+        self.watch_interval = watch_interval
+        self.watcher = None
 
         # Setup UI elements
         self.setup_ui()
+        self.renderer = CanvasRenderer(self.canvas)
 
-        # Flag for running recognition
+        # Flag for running recognition; session tells apart pipelines opened by an earlier start
         self.is_running = False
+        self.session = 0
         self.video_thread = None
+        self.stop_thread = None
+        self.pipelines = []
+        self.pipeline = None
+        self.last_seq = -1
+        self.master.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.poll_updates()
+
+        # Optionally dump performance stats to logs/ for comparing machines and builds
+        self.stats_dumper = None
+        if stats_interval:
+            extension = "jsonl" if stats_format == "json" else "csv"
+            self.stats_dumper = StatsDumper(self.all_stats, os.path.join(self.system.logs_dir,
+                                                                         f"performance_stats.{extension}"),
+                                            stats_interval, stats_format)
+            self.stats_dumper.start()
+
+        # Enroll known faces without blocking the GUI
+        self.enroll_progress = (0, 0)
+        self.enrollment_thread = threading.Thread(target=self.enrollment_worker)
+        self.enrollment_thread.daemon = True
+        self.enrollment_thread.start()
+        self.poll_enrollment()
 
     def setup_ui(self):
         # Create header frame
@@ -72,6 +132,14 @@ class FacialRecognitionGUI:
                                            bg="#e0e0e0", fg="#333333", font=("Arial", 10))
         self.recognition_status.pack(anchor=tk.W, pady=2)
 
+        # Camera selector, only needed when monitoring several sources
+        self.camera_choice = tk.StringVar(value=str(self.sources[0]))
+        if len(self.sources) > 1:
+            tk.Label(self.status_frame, text="Displayed camera:", bg="#e0e0e0",
+                     fg="#333333", font=("Arial", 10)).pack(anchor=tk.W, pady=2)
+            ttk.Combobox(self.status_frame, textvariable=self.camera_choice, state="readonly",
+                         values=[str(source) for source in self.sources]).pack(fill=tk.X, pady=2)
+
         # Latest events section
         self.events_frame = tk.LabelFrame(self.controls_frame, text="Latest Events", bg="#e0e0e0",
                                           font=("Arial", 10, "bold"), padx=10, pady=10)
@@ -97,7 +165,7 @@ class FacialRecognitionGUI:
 
         # Control buttons
         self.start_button = ttk.Button(self.buttons_frame, text="Start Recognition",
-                                       command=self.start_recognition)
+                                       command=self.start_recognition, state=tk.DISABLED)
         self.start_button.pack(fill=tk.X, pady=5)
 
         self.stop_button = ttk.Button(self.buttons_frame, text="Stop Recognition",
@@ -108,6 +176,16 @@ class FacialRecognitionGUI:
                                             command=self.reset_logs)
         self.reset_logs_button.pack(fill=tk.X, pady=5)
 
+        # Performance section: per-stage latency percentiles of the displayed camera and log I/O
+        self.performance_frame = tk.LabelFrame(self.controls_frame, text="Performance", bg="#e0e0e0",
+                                               font=("Arial", 10, "bold"), padx=10, pady=10)
+        self.performance_frame.pack(fill=tk.X, padx=10, pady=10)
+
+        self.performance_label = tk.Label(self.performance_frame, text="Not running", bg="#e0e0e0",
+                                          fg="#333333", font=("Consolas", 8), justify=tk.LEFT, anchor=tk.W,
+                                          wraplength=260)
+        self.performance_label.pack(fill=tk.X)
+
         # Footer
         self.footer_frame = tk.Frame(self.master, bg="#2c3e50", height=30)
         self.footer_frame.pack(fill=tk.X, side=tk.BOTTOM)
@@ -115,31 +193,130 @@ class FacialRecognitionGUI:
         tk.Label(self.footer_frame, text="© 2025 Advanced Security Systems",
                  font=("Arial", 8), bg="#2c3e50", fg="white").pack(pady=5)
 
-        # Update loaded faces count
-        self.faces_loaded.config(text=f"Loaded Faces: {len(self.system.known_face_names)}")
+        # Loaded faces count is filled in as enrollment progresses
+        self.faces_loaded.config(text="Loaded Faces: loading...")
 
     def log_event(self, message):
         """Add event message to the events log with timestamp"""
+        self.show_events([message])
+
+    def post_event(self, message):
+        """Queue an event message for the events log; safe to call from any thread"""
+        self.updates.put(("event", message))
+
+    def show_events(self, messages, max_lines=500):
+        """Add several event messages to the events log in one update.
+
+        Repeats of the same message are coalesced into one line with a count,
+        and only the newest max_lines lines are kept.
+        """
+        counts = {}
+        for message in messages:
+            counts[message] = counts.get(message, 0) + 1
+        if not counts:
+            return
+
         timestamp = datetime.now().strftime("%H:%M:%S")
-        log_entry = f"[{timestamp}] {message}\n"
+        log_entries = "".join(f"[{timestamp}] {message}" + (f" (x{count})" if count > 1 else "") + "\n"
+                              for message, count in counts.items())
 
         self.events_log.config(state=tk.NORMAL)
-        self.events_log.insert(tk.END, log_entry)
+        self.events_log.insert(tk.END, log_entries)
+        self.events_log.delete("1.0", f"end-{max_lines + 1}l")
         self.events_log.see(tk.END)  # Auto-scroll to the end
         self.events_log.config(state=tk.DISABLED)
 
+    def poll_updates(self):
+        """Apply queued updates from worker threads and render, at most render_fps times a second"""
+        start = time.perf_counter()
+
+        messages = []
+        while True:
+            try:
+                kind, payload = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "event":
+                messages.append(payload)
+            elif kind == "reload":
+                self.update_faces_loaded()
+                messages.append(f"Known faces reloaded: {payload.identities} faces")
+            elif kind == "pipelines":
+                self.on_pipelines_opened(*payload)
+        self.show_events(messages)
+
+        if self.is_running and self.pipelines:
+            self.render_latest()
+
+        # The table is cheap but not free to build; once a second is plenty
+        if start - self.last_panel_update >= 1.0:
+            self.last_panel_update = start
+            self.update_performance_panel()
+
+        delay = self.render_interval - (time.perf_counter() - start)
+        self.master.after(max(1, int(delay * 1000)), self.poll_updates)
+
+    def enrollment_worker(self):
+        """Load known faces in a background thread, recording progress for the GUI"""
+        def on_progress(done, total):
+            self.enroll_progress = (done, total)
+
+        try:
+            self.system.load_known_faces(progress_callback=on_progress)
+        except Exception as e:
+            print(f"Error loading known faces: {e}")
+
+    def poll_enrollment(self):
+        """Update the Loaded Faces label from the enrollment thread's progress"""
+        if self.enrollment_thread.is_alive():
+            done, total = self.enroll_progress
+            self.faces_loaded.config(text=f"Loaded Faces: {done}/{total} images...")
+            self.master.after(200, self.poll_enrollment)
+            return
+
+        self.update_faces_loaded()
+        self.start_button.config(state=tk.NORMAL)
+
+        if self.watch_interval:
+            self.watcher = GalleryWatcher(self.system, self.watch_interval, on_reload=self.on_gallery_reload)
+            self.watcher.start()
+
+        summary = self.system.enrollment_summary
+        if summary is None:
+            self.log_event("ERROR: Could not load known faces!")
+            return
+        self.log_event(f"Loaded {summary.identities} faces from {summary.loaded} images ({summary.cached} cached)")
+        if summary.failures:
+            counts = {}
+            for _, reason in summary.failures:
+                counts[reason] = counts.get(reason, 0) + 1
+            for reason, count in sorted(counts.items()):
+                self.log_event(f"{ENROLL_MESSAGES[reason]}: {count} image(s)")
+
+    def update_faces_loaded(self):
+        """Show the size of the current gallery in the Loaded Faces label"""
+        self.faces_loaded.config(text=f"Loaded Faces: {len(self.system.matcher)} "
+                                      f"({self.system.matcher.template_count} images)")
+
+    def on_gallery_reload(self, summary):
+        """Called from the watcher thread after a hot reload; picked up by poll_updates"""
+        self.updates.put(("reload", summary))
+
     def start_recognition(self):
-        """Start the recognition process in a separate thread"""
+        """Start the recognition process; cameras are opened in a separate thread"""
         if not self.is_running:
             self.is_running = True
-            self.video_thread = threading.Thread(target=self.recognition_thread)
+            self.session += 1
+            self.pipelines = []
+            self.pipeline = None
+            self.video_thread = threading.Thread(target=self.recognition_thread, args=(self.session,))
             self.video_thread.daemon = True
             self.video_thread.start()
 
             # Update UI
             self.start_button.config(state=tk.DISABLED)
             self.stop_button.config(state=tk.NORMAL)
-            self.camera_status.config(text="Camera: Active", fg="#28a745")
+            self.camera_status.config(text=f"Camera: Active ({len(self.sources)})", fg="#28a745")
             self.recognition_status.config(text="Recognition: Running", fg="#28a745")
             self.log_event("Recognition system started")
 
@@ -147,7 +324,8 @@ class FacialRecognitionGUI:
         """Stop the recognition process"""
         if self.is_running:
             self.is_running = False
-            # Thread will exit on next iteration
+            pipelines, self.pipelines = self.pipelines, []
+            self.stop_pipelines(pipelines)
 
             # Update UI
             self.start_button.config(state=tk.NORMAL)
@@ -156,152 +334,154 @@ class FacialRecognitionGUI:
             self.recognition_status.config(text="Recognition: Standby", fg="#333333")
             self.log_event("Recognition system stopped")
 
+    def on_close(self):
+        """Stop recognition and worker processes before closing the window"""
+        self.stop_recognition()
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.stats_dumper is not None:
+            self.stats_dumper.stop()
+        if self.video_thread is not None:
+            self.video_thread.join(timeout=2)
+        if self.stop_thread is not None:
+            self.stop_thread.join(timeout=5)
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.system.close()
+        self.master.destroy()
+
     def reset_logs(self):
         """Reset system logs"""
         self.system.reset_logs()
         self.log_event("Log file has been reset")
 
-    def recognition_thread(self):
-        """Run face recognition processing in a separate thread"""
-        # Open video capture
-        video_capture = cv2.VideoCapture(0)
-
-        if not video_capture.isOpened():
-            self.log_event("ERROR: Could not open webcam!")
-            self.stop_recognition()
+    def recognition_thread(self, session):
+        """Open one RecognitionPipeline per source (slow, so not in the Tk main loop) and hand them to the GUI"""
+        if self.workers > 0 and self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=SPAWN)
+
+        pipelines = []
+        for source in self.sources:
+            pipeline = RecognitionPipeline(self.system, source=source, on_event=self.post_event,
+                                           executor=self.executor, name=str(source), target_fps=self.target_fps,
+                                           motion_gating=self.motion_gating, roi=self.roi)
+            if pipeline.start():
+                pipelines.append(pipeline)
+            else:
+                self.post_event(f"ERROR: Could not open camera {source}!")
+
+        self.updates.put(("pipelines", (session, pipelines)))
+
+    def all_stats(self):
+        """Return {name: PipelineStats} of every running pipeline and the system's I/O"""
+        stats = {pipeline.name: pipeline.stats for pipeline in self.pipelines}
+        stats["system"] = self.system.stats
+        return stats
+
+    def update_performance_panel(self):
+        """Show the stage timings of the displayed camera and of log I/O in the Performance panel"""
+        lines = []
+        if self.is_running and self.pipeline is not None:
+            lines.append(self.pipeline.stats.panel_text())
+        if self.system.stats.counters:
+            lines.append(self.system.stats.panel_text().split("\n", 1)[1])
+        self.performance_label.config(text="\n".join(lines) or "Not running")
+
+    def on_pipelines_opened(self, session, pipelines):
+        """Start displaying the pipelines opened by recognition_thread"""
+        if not self.is_running or session != self.session:
+            # Recognition was stopped while the cameras were opening
+            self.stop_pipelines(pipelines)
             return
 
-        # To track recognized students
-        recognized_students = set()
-        last_student_time = {}
-        last_intruder_time = 0
-
-        # Cooldown settings
-        in_cooldown = False
-        cooldown_end_time = 0
-        cooldown_duration = 2  # seconds
-
-        # For intruder tracking
-        intruder_photo_saved = False
-
-        while self.is_running:
-            # Capture frame
-            ret, frame = video_capture.read()
-            if not ret:
-                self.log_event("ERROR: Failed to grab frame!")
-                break
-
-            display_frame = frame.copy()
-
-            # Check cooldown period
-            current_time = time.time()
-            if in_cooldown and current_time < cooldown_end_time:
-                # Add processing indicator
-                self.add_overlay_text(display_frame, "Processing...", position=(20, 40),
-                                      color=(0, 120, 255), size=0.8, thickness=2)
-            else:
-                in_cooldown = False
+        self.pipelines = pipelines
+        self.last_seq = -1
+        if not pipelines:
+            self.stop_recognition()
 
-                # Process faces
-                # Resize frame for faster processing
-                small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    def stop_pipelines(self, pipelines):
+        """Stop pipelines in a background thread so joining them does not block the GUI"""
+        def stop_all(previous):
+            if previous is not None:
+                previous.join()
+            for pipeline in pipelines:
+                pipeline.stop()
+                print(f"Pipeline stats [{pipeline.name}]: {pipeline.stats.summary()}")
+
+        if pipelines:
+            self.stop_thread = threading.Thread(target=stop_all, args=(self.stop_thread,))
+            self.stop_thread.daemon = True
+            self.stop_thread.start()
+
+    def render_latest(self):
+        """Render the newest frame of the selected camera, if there is one we have not shown"""
+        # Switching cameras restarts the sequence numbering
+        pipeline = self.selected_pipeline()
+        if pipeline is not self.pipeline:
+            self.pipeline = pipeline
+            self.last_seq = -1
+
+        item = pipeline.capture.read_latest(after_seq=self.last_seq, timeout=0)
+        if item is None:
+            if not any(p.capture.running for p in self.pipelines):
+                if any(p.capture.failed for p in self.pipelines):
+                    self.log_event("ERROR: Failed to grab frame!")
+                else:
+                    self.log_event("End of video reached")
+                self.stop_recognition()
+            # A source that ended or failed stays on screen while others run
+            return
 
-                # Find faces
-                face_locations = face_recognition.face_locations(rgb_small_frame)
-                face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-
-                # Process each face
-                for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-                    # Scale back face locations
-                    top *= 4
-                    right *= 4
-                    bottom *= 4
-                    left *= 4
-
-                    # Check if face matches known faces
-                    matches = face_recognition.compare_faces(self.system.known_face_encodings, face_encoding)
-
-                    if True in matches:
-                        # Find best match
-                        face_distances = face_recognition.face_distance(self.system.known_face_encodings, face_encoding)
-                        best_match_index = np.argmin(face_distances)
-
-                        if matches[best_match_index]:
-                            name = self.system.known_face_names[best_match_index]
-                            confidence = (1 - face_distances[best_match_index]) * 100
-
-                            # Check for cooldown
-                            current_time = time.time()
-                            if name in last_student_time:
-                                time_since_last = current_time - last_student_time[name]
-                                if time_since_last < cooldown_duration:
-                                    # Just draw but don't log
-                                    self.draw_face_box(display_frame, left, top, right, bottom,
-                                                       name, confidence, is_known=True)
-                                    continue
-
-                            # Log new arrival
-                            if name not in recognized_students:
-                                self.system.log_arrival(name)
-                                recognized_students.add(name)
-                                self.log_event(f"Welcome {name}!")
-
-                                # Set cooldown
-                                in_cooldown = True
-                                cooldown_end_time = current_time + cooldown_duration
-
-                            # Update timestamp
-                            last_student_time[name] = current_time
-
-                            # Draw face box with name
-                            self.draw_face_box(display_frame, left, top, right, bottom,
-                                               name, confidence, is_known=True)
-                    else:
-                        # Unknown face
-                        self.draw_face_box(display_frame, left, top, right, bottom,
-                                           "Unknown", 0, is_known=False)
-
-                        # Save intruder image once per session
-                        current_time = time.time()
-                        if not intruder_photo_saved:
-                            self.system.save_intruder_image(frame)
-                            intruder_photo_saved = True
-                            last_intruder_time = current_time
-                            self.log_event("⚠️ Intruder detected!")
-
-                            # Set cooldown
-                            in_cooldown = True
-                            cooldown_end_time = current_time + cooldown_duration
-
-            # Add system info overlay
-            self.add_system_info(display_frame)
-
-            # Convert to PIL format for tkinter
-            display_frame = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(display_frame)
-
-            # Resize to fit canvas if needed
-            canvas_width = self.canvas.winfo_width()
-            canvas_height = self.canvas.winfo_height()
-            if canvas_width > 1 and canvas_height > 1:  # Ensure valid dimensions
-                img = img.resize((canvas_width, canvas_height), Image.LANCZOS)
-
-            imgtk = ImageTk.PhotoImage(image=img)
-
-            # Update canvas with new image
-            self.canvas.create_image(0, 0, anchor=tk.NW, image=imgtk)
-            self.canvas.image = imgtk  # Keep reference
-
-            # Process GUI events
-            self.master.update_idletasks()
-            self.master.update()
-
-            # Short delay
-            time.sleep(0.03)
-
-        # Release video when done
-        video_capture.release()
+        seq, frame, _ = item
+        if self.last_seq >= 0 and seq > self.last_seq + 1:
+            pipeline.stats.increment("display_dropped", seq - self.last_seq - 1)
+        self.last_seq = seq
+
+        render_start = time.perf_counter()
+        self.render_frame(pipeline, frame)
+        pipeline.stats.record("render", time.perf_counter() - render_start)
+
+    def render_frame(self, pipeline, frame):
+        """Draw a camera frame with its pipeline's latest results onto the canvas"""
+        start = time.perf_counter()
+
+        # Resizing into the canvas-sized buffer is the only copy of the frame
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        if canvas_width <= 1 or canvas_height <= 1:  # Canvas not laid out yet
+            canvas_height, canvas_width = frame.shape[:2]
+        display_frame = self.renderer.prepare(frame, canvas_width, canvas_height)
+        scale_x = canvas_width / float(frame.shape[1])
+        scale_y = canvas_height / float(frame.shape[0])
+
+        # Outline the region faces are looked for in
+        if self.roi is not None:
+            cv2.polylines(display_frame, self.roi.pixel_polygons(canvas_width, canvas_height), True, (255, 200, 0), 1)
+
+        # Draw the most recent recognition results, scaled to the canvas
+        result = pipeline.latest_result
+        if result.processing:
+            self.add_overlay_text(display_frame, "Processing...", position=(20, 40),
+                                  color=(0, 120, 255), size=0.8, thickness=2)
+        for face in result.faces:
+            top, right, bottom, left = face.box
+            self.draw_face_box(display_frame, int(left * scale_x), int(top * scale_y),
+                               int(right * scale_x), int(bottom * scale_y),
+                               face.name, face.confidence, is_known=face.is_known)
+
+        # Add system info overlay
+        self.add_system_info(display_frame, pipeline.stats)
+        pipeline.stats.record("draw", time.perf_counter() - start)
+
+        self.renderer.show()
+
+    def selected_pipeline(self):
+        """Return the pipeline of the camera chosen for display"""
+        choice = self.camera_choice.get()
+        for pipeline in self.pipelines:
+            if pipeline.name == choice:
+                return pipeline
+        return self.pipelines[0]
 
     def draw_face_box(self, frame, left, top, right, bottom, name, confidence=0, is_known=True):
         """Draw a professional looking face detection box"""
@@ -352,19 +532,24 @@ class FacialRecognitionGUI:
         # Draw main text
         cv2.putText(frame, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, size, color, thickness)
 
-    def add_system_info(self, frame):
+    def add_system_info(self, frame, stats=None):
         """Add system information overlay to the video frame"""
         height, width = frame.shape[:2]
 
-        # Semi-transparent overlay background
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (5, height - 85), (250, height - 5), (30, 30, 30), cv2.FILLED)
-        cv2.addWeighted(overlay, 0.7, frame, 0.3, 0, frame)
+        stats_lines = stats.overlay_text() if stats is not None else []
+
+        # Semi-transparent overlay background, blended in place over just the info box:
+        # 0.3 * pixel + 0.7 * 30 is the same as blending with a (30, 30, 30) rectangle
+        info_box = frame[max(0, height - 85 - 20 * len(stats_lines)):max(0, height - 4), 5:331]
+        cv2.convertScaleAbs(info_box, dst=info_box, alpha=0.3, beta=0.7 * 30)
 
         # System info text
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for i, line in enumerate(stats_lines):
+            self.add_overlay_text(frame, line, (10, height - 80 - 20 * (len(stats_lines) - 1 - i)),
+                                  (200, 200, 200), size=0.5)
         self.add_overlay_text(frame, f"Date: {now}", (10, height - 60), (200, 200, 200))
-        self.add_overlay_text(frame, f"Faces Loaded: {len(self.system.known_face_names)}",
+        self.add_overlay_text(frame, f"Faces Loaded: {len(self.system.matcher)}",
                               (10, height - 40), (200, 200, 200))
         self.add_overlay_text(frame, f"System: Running", (10, height - 20), (0, 255, 128))
 
@@ -373,33 +558,122 @@ class FacialRecognitionGUI:
                     cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 150, 255), 2)
 
 
+class CanvasRenderer:
+    """Show video frames on a Tk canvas without per-frame allocations.
+
+    Frames are resized straight into a preallocated canvas-sized BGR buffer
+    (which callers then draw on), converted into a preallocated RGB buffer
+    and pasted into one PhotoImage shown by a single persistent canvas item.
+    Buffers are only reallocated when the canvas size changes.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.size = None
+        self.bgr = None
+        self.rgb = None
+        self.photo = None
+        self.item = None
+
+    def prepare(self, frame, width, height):
+        """Resize frame into the display buffer and return it for drawing."""
+        if self.size != (width, height):
+            self.size = (width, height)
+            self.bgr = np.empty((height, width, 3), dtype=np.uint8)
+            self.rgb = np.empty((height, width, 3), dtype=np.uint8)
+            self.photo = ImageTk.PhotoImage("RGB", (width, height))
+            if self.item is None:
+                self.item = self.canvas.create_image(0, 0, anchor=tk.NW, image=self.photo)
+            else:
+                self.canvas.itemconfig(self.item, image=self.photo)
+
+        cv2.resize(frame, (width, height), dst=self.bgr, interpolation=cv2.INTER_LINEAR)
+        return self.bgr
+
+    def show(self):
+        """Push the display buffer to the canvas."""
+        cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        # fromarray wraps the buffer without copying; paste copies it into Tk's image
+        self.photo.paste(Image.fromarray(self.rgb))
+
+
 class FacialRecognitionSystem:
-    def __init__(self, reset_logs=False):
+    def __init__(self, reset_logs=False, load_faces=True, enroll_workers=None, matcher_type="exact", ivf_nprobe=8,
+                 log_fsync_interval=5.0, snapshot_mode="full", snapshot_quality=90, intruder_quota_mb=None,
+                 intruder_retention_days=None, log_backend="csv", reentry_minutes=None, gallery_precision="float32"):
         self.known_face_encodings = []
         self.known_face_names = []
+        self.enroll_workers = enroll_workers or os.cpu_count() or 1
+        self.tolerance = 0.6
+        self.matcher_type = matcher_type
+        self.ivf_nprobe = ivf_nprobe
+        self.gallery_precision = gallery_precision
+        if matcher_type == "ivf" and gallery_precision != "float32":
+            raise ValueError("the IVF matcher only supports a float32 gallery")
+        self.matcher = self.build_matcher([], [])
+        self.enrollment_summary = None
+        self.enroll_lock = threading.Lock()
+        self.gallery_snapshot = {}
         self.known_faces_dir = "known_faces"
         self.logs_dir = "logs"
         self.intruder_dir = "intruder"
+        self.cache_dir = "cache"
         self.log_file = os.path.join(self.logs_dir, "arrival_logs.csv")
         self.intruder_log_file= os.path.join(self.logs_dir, "intruder_logs.csv")
+        self.log_meta_file = os.path.join(self.logs_dir, "arrival_logs.meta.json")
         self.log_counter = 1
+        self.log_lock = threading.Lock()
+        # Size of the CSV log, and the day and offset at which today's wall-clock writing began
+        self.log_size = 0
+        self.log_day = None
+        self.log_day_offset = 0
+        self.event_store = None
 
         # Create required directories
-        for directory in [self.known_faces_dir, self.logs_dir, self.intruder_dir]:
+        for directory in [self.known_faces_dir, self.logs_dir, self.intruder_dir, self.cache_dir]:
             if not os.path.exists(directory):
                 os.makedirs(directory)
                 print(f"Created directory: {directory}")
 
-        # Create or reset log files
-        self.init_log_file(reset=reset_logs)
-        self.init_intruder_log_file(reset=reset_logs)
+        if log_backend == "sqlite":
+            # Events go to an indexed SQLite database; existing CSV logs are imported once
+            self.event_store = EventStore(os.path.join(self.logs_dir, "attendance.db"))
+            if reset_logs:
+                self.event_store.reset()
+            elif not self.event_store.migrated():
+                self.event_store.import_csv(self.log_file, self.intruder_log_file)
+            self.log_counter = self.event_store.last_log_number() + 1
+        else:
+            # Create or reset log files
+            self.init_log_file(reset=reset_logs)
+            self.init_intruder_log_file(reset=reset_logs)
+
+            # Initialize log counter
+            if not reset_logs:
+                self.initialize_log_counter()
 
-        # Initialize log counter
+        # Who has already arrived today, so restarts and other cameras don't log them again
+        self.arrival_index = ArrivalIndex(reentry_minutes * 60 if reentry_minutes else None)
         if not reset_logs:
-            self.initialize_log_counter()
+            self.load_arrival_index()
 
-        # Load known faces
-        self.load_known_faces()
+        # Timings of the background log and snapshot I/O
+        self.stats = PipelineStats()
+
+        # Log rows are appended (or inserted into the event store) in batches by a background thread
+        self.log_writer = LogWriter(fsync_interval=log_fsync_interval, on_write=self.on_log_write, stats=self.stats,
+                                    store=self.event_store)
+
+        # Intruder snapshots are encoded and stored by another background thread
+        self.snapshot_writer = SnapshotWriter(
+            self.intruder_dir, mode=snapshot_mode, jpeg_quality=snapshot_quality,
+            max_bytes=intruder_quota_mb * 1024 * 1024 if intruder_quota_mb else None,
+            retention_days=intruder_retention_days, stats=self.stats)
+
+        # Load known faces (re-using cached encodings where possible)
+        self.encoding_cache = EncodingCache(self.cache_dir)
+        if load_faces:
+            self.load_known_faces()
 
     def init_log_file(self, reset=False):
         """Initialize the log file with headers, optionally resetting the file."""
@@ -411,6 +685,10 @@ class FacialRecognitionSystem:
                     writer = csv.writer(file)
                     writer.writerow(['Log No.', 'Roll no.', 'Date', 'Time'])
                 print(f"{'Reset' if reset else 'Created'} log file: {self.log_file}")
+                self.log_size = os.path.getsize(self.log_file)
+                self.log_day = datetime.now().strftime("%Y-%m-%d")
+                self.log_day_offset = 0
+                self.write_log_meta(1, self.log_size)
                 if reset:
                     self.log_counter = 1
             except Exception as e:
@@ -435,104 +713,2567 @@ class FacialRecognitionSystem:
             print(f"Intruder log file exists at: {self.intruder_log_file}")
 
     def initialize_log_counter(self):
-        """Initialize log counter based on existing log entries."""
+        """Initialize log counter (and where today's rows start) from the log metadata, or the log tail."""
         try:
-            if os.path.exists(self.log_file) and os.path.getsize(self.log_file) > 0:
-                with open(self.log_file, 'r', newline='') as file:
-                    reader = csv.reader(file)
-                    rows = list(reader)
-
-                    if len(rows) > 1:
-                        try:
-                            log_numbers = [int(row[0]) for row in rows[1:] if row and row[0].isdigit()]
-                            if log_numbers:
-                                self.log_counter = max(log_numbers) + 1
-                        except Exception as e:
-                            print(f"Error parsing existing log numbers: {e}")
+            if not os.path.exists(self.log_file) or os.path.getsize(self.log_file) == 0:
+                return
+            log_size = self.log_size = os.path.getsize(self.log_file)
+            today = datetime.now().strftime("%Y-%m-%d")
+            self.log_day = today
+
+            try:
+                with open(self.log_meta_file, 'r') as file:
+                    meta = json.load(file)
+                if meta.get("log_size") == log_size:
+                    self.log_counter = int(meta["next_log_number"])
+                    if "day" in meta:
+                        # Nothing was written since the recorded day if it is not today
+                        self.log_day_offset = int(meta["day_offset"]) if meta["day"] == today else log_size
+                    return
+            except (OSError, ValueError, KeyError):
+                pass
+
+            last_number = self.read_last_log_number()
+            if last_number is not None:
+                self.log_counter = last_number + 1
+            self.write_log_meta(self.log_counter, log_size)
         except Exception as e:
             print(f"Error initializing log counter: {e}")
 
+    def read_log_tail(self, done, chunk_size=64 * 1024):
+        """Return the parsed rows at the end of the log, reading backwards in growing chunks.
+
+        Stops as soon as done(rows) is true for the rows read so far (or the
+        whole file has been read).
+        """
+        with open(self.log_file, 'rb') as file:
+            file.seek(0, os.SEEK_END)
+            end = file.tell()
+            read_size = chunk_size
+            while True:
+                start = max(0, end - read_size)
+                file.seek(start)
+                lines = file.read(end - start).decode('utf-8', errors='replace').splitlines()
+                if start > 0:
+                    lines = lines[1:]  # first line may be cut in half
+
+                rows = list(csv.reader(lines))
+                if start == 0 or done(rows):
+                    return rows
+                read_size *= 2
+
+    def read_last_log_number(self):
+        """Return the highest log number among the last rows of the log."""
+        try:
+            rows = self.read_log_tail(lambda rows: any(row and row[0].isdigit() for row in rows))
+            log_numbers = [int(row[0]) for row in rows if row and row[0].isdigit()]
+        except Exception as e:
+            print(f"Error parsing existing log numbers: {e}")
+            return None
+        return max(log_numbers) if log_numbers else None
+
+    def load_arrival_index(self):
+        """Fill the arrival index with today's arrivals from the log store.
+
+        The CSV log is read from where today's writing began; rows there can
+        still be from other days (headless back-fill), so they are filtered
+        by date.
+        """
+        now = datetime.now().replace(microsecond=0)
+        today = now.strftime("%Y-%m-%d")
+        try:
+            if self.event_store is not None:
+                arrivals = self.event_store.last_arrivals_on(today)
+            else:
+                arrivals = self.read_logged_arrivals(today, self.log_day_offset if self.log_day == today else 0)
+            self.arrival_index.load(today, arrivals, seen_at=now)
+        except Exception as e:
+            print(f"Error reading today's arrivals: {e}")
+
+    def load_arrivals_on(self, date_str):
+        """Add the arrivals already logged on date_str to the arrival index (for back-filling that day)."""
+        try:
+            # Rows still queued would otherwise be missed
+            self.log_writer.flush()
+            if self.event_store is not None:
+                arrivals = self.event_store.last_arrivals_on(date_str)
+            else:
+                arrivals = self.read_logged_arrivals(date_str)
+            self.arrival_index.load(date_str, arrivals)
+        except Exception as e:
+            print(f"Error reading arrivals on {date_str}: {e}")
+
+    def read_logged_arrivals(self, date_str, offset=0):
+        """Return (roll_no, "HH:MM:SS") for the CSV log rows dated date_str from offset onwards."""
+        if not os.path.exists(self.log_file):
+            return []
+        with open(self.log_file, 'rb') as file:
+            file.seek(0, os.SEEK_END)
+            if offset > file.tell():
+                offset = 0  # the log was truncated behind our back
+            file.seek(offset)
+            lines = file.read().decode('utf-8', errors='replace').splitlines()
+        return [(row[1], row[3]) for row in csv.reader(lines)
+                if len(row) >= 4 and row[0].isdigit() and row[2] == date_str]
+
+    def write_log_meta(self, next_log_number, log_size):
+        """Record the next log number, the log size it is valid for and where today's rows start."""
+        try:
+            with open(self.log_meta_file + ".tmp", 'w') as file:
+                json.dump({"next_log_number": next_log_number, "log_size": log_size,
+                           "day": self.log_day, "day_offset": self.log_day_offset}, file)
+            os.replace(self.log_meta_file + ".tmp", self.log_meta_file)
+        except OSError as e:
+            print(f"Error writing log metadata: {e}")
+
+    def on_log_write(self, path, rows, size):
+        """Keep the log metadata in step after the writer appended a batch of rows."""
+        if path == self.log_file:
+            today = datetime.now().strftime("%Y-%m-%d")
+            if self.log_day != today:
+                # First write of a new day: today's rows start after the previous write
+                self.log_day, self.log_day_offset = today, self.log_size
+            self.log_size = size
+            self.write_log_meta(max(int(row[0]) for row in rows) + 1, size)
+
     def reset_logs(self):
         """Reset log files and counter to start from 1."""
-        self.init_log_file(reset=True)
-        self.init_intruder_log_file(reset=True)
+        # Don't let queued rows land in the fresh files
+        self.log_writer.flush()
+        with self.log_lock:
+            if self.event_store is not None:
+                self.event_store.reset()
+                self.log_counter = 1
+            else:
+                self.init_log_file(reset=True)
+                self.init_intruder_log_file(reset=True)
+        self.arrival_index.clear()
         print("Log files have been reset. Numbering will start from 1.")
 
-    def load_known_faces(self):
-        """Load known faces from the known_faces directory."""
+    def close(self):
+        """Write out queued snapshots and log rows and stop the background writers."""
+        # Snapshots write log rows when saved, so they go first
+        self.snapshot_writer.close()
+        self.log_writer.close()
+        if self.event_store is not None:
+            self.event_store.close()
+
+    def load_known_faces(self, progress_callback=None, low_priority=False):
+        """Load known faces from the known_faces directory (files and per-identity subdirectories).
+
+        Only images missing from the encoding cache are encoded.  progress_callback(done, total)
+        is called after every image; low_priority encodes in one niced worker process.
+        """
+        with self.enroll_lock:
+            self._load_known_faces(progress_callback, low_priority)
+
+    def _load_known_faces(self, progress_callback, low_priority):
         print("Loading known faces...")
+        self.encoding_cache.load()
+
+        images = self.list_enrollment_images()
+        names = dict(images)
+        total = len(images)
+        done = 0
 
-        for filename in os.listdir(self.known_faces_dir):
-            if filename.endswith(('.png', '.jpg', '.jpeg')):
-                name = os.path.splitext(filename)[0]
-                image_path = os.path.join(self.known_faces_dir, filename)
+        records = {}
+        pending = []
+        snapshot = {}
+        for image_path, name in images:
+            try:
+                stat = os.stat(image_path)
+                snapshot[image_path] = (stat.st_size, stat.st_mtime_ns)
+                cached = self.encoding_cache.lookup(image_path, stat)
+            except OSError as e:
+                records[image_path] = CacheRecord(image_path, name, 0, 0, None, None, ENROLL_UNREADABLE)
+                print(f"Error reading {image_path}: {e}")
+                cached = None
+                stat = None
+
+            if cached is not None:
+                records[image_path] = cached
+                done += 1
+                if progress_callback:
+                    progress_callback(done, total)
+            elif stat is not None:
+                pending.append((image_path, stat))
+
+        reused = done
+        for image_path, stat, (status, encoding, digest) in self._encode_images(pending, low_priority):
+            records[image_path] = CacheRecord(image_path, names[image_path], stat.st_size, stat.st_mtime_ns,
+                                              digest, encoding, status)
+            done += 1
+            if progress_callback:
+                progress_callback(done, total)
+
+        # Keep directory order so the gallery rows are stable between runs
+        records = [records[image_path] for image_path, _ in images]
+        failures = [(os.path.relpath(record.path, self.known_faces_dir), record.status) for record in records
+                    if record.status != ENROLL_OK]
+
+        # Files we could not even read have no fingerprint and are retried next time
+        records = [record for record in records if record.sha1 is not None]
+        matrix = self.encoding_cache.update(records)
+        # The cache matrix itself (memory-mapped), not a list of per-row arrays
+        self.known_face_encodings = matrix
+        self.known_face_names = [record.name for record in records if record.encoding is not None]
+        self.matcher = self.build_matcher(self.known_face_encodings, self.known_face_names)
+        self.gallery_snapshot = snapshot
+
+        self.enrollment_summary = EnrollmentSummary(total=total, loaded=len(self.known_face_names),
+                                                    identities=len(self.matcher), pruned=self.matcher.pruned,
+                                                    cached=reused, encoded=len(pending), failures=failures)
+        self.print_enrollment_summary()
+
+    def list_enrollment_images(self):
+        """Return (image_path, identity name) for every enrollment image, in a stable order."""
+        extensions = ('.png', '.jpg', '.jpeg')
+        images = []
+        for entry in sorted(os.listdir(self.known_faces_dir)):
+            path = os.path.join(self.known_faces_dir, entry)
+            if os.path.isdir(path):
+                # One directory per identity, any number of images inside
+                images.extend((os.path.join(path, filename), entry) for filename in sorted(os.listdir(path))
+                              if filename.endswith(extensions))
+            elif entry.endswith(extensions):
+                images.append((path, os.path.splitext(entry)[0]))
+        return images
+
+    def build_matcher(self, encodings, names):
+        """Create the matcher used by the recognition loop for the given gallery."""
+        if self.matcher_type == "ivf":
+            return IVFFaceMatcher(encodings, names, self.tolerance, nprobe=self.ivf_nprobe)
+        if self.gallery_precision in ("float16", "int8"):
+            return CompactFaceMatcher(encodings, names, self.tolerance, precision=self.gallery_precision)
+        return FaceMatcher(encodings, names, self.tolerance)
+
+    def gallery_changed(self):
+        """Check (by file size and mtime only) whether known_faces/ differs from the loaded gallery."""
+        snapshot = {}
+        for image_path, _ in self.list_enrollment_images():
+            try:
+                stat = os.stat(image_path)
+            except OSError:
+                continue
+            snapshot[image_path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot != self.gallery_snapshot
+
+    def _encode_images(self, pending, low_priority=False):
+        """Yield (image_path, stat, encode_face_image result) for each pending image."""
+        if not pending:
+            return
+        if not low_priority and (self.enroll_workers <= 1 or len(pending) <= 1):
+            for image_path, stat in pending:
+                yield image_path, stat, encode_face_image(image_path)
+            return
 
+        workers = 1 if low_priority else min(self.enroll_workers, len(pending))
+        initializer = lower_process_priority if low_priority else None
+        print(f"Encoding {len(pending)} images with {workers} worker processes...")
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer, mp_context=SPAWN) as executor:
+            futures = {executor.submit(encode_face_image, image_path): (image_path, stat)
+                       for image_path, stat in pending}
+            for future in as_completed(futures):
+                image_path, stat = futures[future]
                 try:
-                    image = face_recognition.load_image_file(image_path)
-                    encoding = face_recognition.face_encodings(image)[0]
-                    self.known_face_encodings.append(encoding)
-                    self.known_face_names.append(name)
-                    print(f"Loaded face: {name}")
-                except IndexError:
-                    print(f"No face found in {filename}. Skipping.")
-                except Exception as e:
-                    print(f"Error loading {filename}: {e}")
-
-        print(f"Loaded {len(self.known_face_names)} known faces")
-
-    def log_arrival(self, name):
-        """Log student arrival with timestamp and log number to CSV."""
-        now = datetime.now()
+                    result = future.result()
+                except Exception:
+                    # A worker crashed (e.g. a decoder segfault); count the file as unreadable
+                    result = (ENROLL_UNREADABLE, None, None)
+                yield image_path, stat, result
+
+    def print_enrollment_summary(self):
+        """Print a short summary of the last enrollment, grouping failures by reason."""
+        summary = self.enrollment_summary
+        print(f"Loaded {summary.identities} known faces from {summary.loaded} face images out of {summary.total} "
+              f"({summary.cached} from cache, {summary.encoded} encoded, {summary.pruned} outlier templates pruned)")
+        if isinstance(self.matcher, CompactFaceMatcher):
+            print(f"  {self.matcher.precision} gallery: {self.matcher.nbytes / 1024 ** 2:.1f} MB "
+                  f"instead of {self.matcher.float32_nbytes / 1024 ** 2:.1f} MB")
+
+        by_reason = {}
+        for filename, reason in summary.failures:
+            by_reason.setdefault(reason, []).append(filename)
+        for reason, filenames in sorted(by_reason.items()):
+            shown = ", ".join(filenames[:10])
+            more = f" and {len(filenames) - 10} more" if len(filenames) > 10 else ""
+            print(f"  {ENROLL_MESSAGES[reason]} ({len(filenames)}): {shown}{more}")
+
+    def log_arrival(self, name, timestamp=None):
+        """Log student arrival with timestamp (default now) and log number to CSV or the event store."""
+        now = timestamp or datetime.now()
         date_str = now.strftime("%Y-%m-%d")
         time_str = now.strftime("%H:%M:%S")
-        log_number = self.log_counter
-        self.log_counter += 1
+        with self.log_lock:
+            log_number = self.log_counter
+            self.log_counter += 1
 
         # Print welcome message to console
         print(f"Welcome to CGC, {name}! - {date_str} {time_str}")
 
-        # Write to CSV file
-        try:
-            if not os.path.exists(self.log_file):
-                with open(self.log_file, 'w', newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(['Log No.', 'Roll no.', 'Date', 'Time'])
-
-            with open(self.log_file, 'a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([log_number, name, date_str, time_str])
-        except Exception as e:
-            print(f"Error writing to log file: {e}")
-
-    def save_intruder_image(self, frame):
-        """Save unknown face as intruder with timestamp and log the detection."""
-        now = datetime.now()
-        timestamp = now.strftime("%Y%m%d_%H%M%S")
+        # Queue the row for the background writer
+        target = "arrivals" if self.event_store is not None else self.log_file
+        self.log_writer.write(target, [log_number, name, date_str, time_str],
+                              header=['Log No.', 'Roll no.', 'Date', 'Time'])
+
+    def save_intruder_image(self, frame, timestamp=None, face_box=None, camera=None):
+        """Save unknown face as intruder with timestamp and log the detection once the image is stored."""
+        now = timestamp or datetime.now()
+        timestamp = now.strftime("%Y%m%d_%H%M%S_") + f"{now.microsecond // 1000:03d}"
+        if camera is not None:
+            timestamp += "_" + "".join(c if c.isalnum() else "-" for c in str(camera))[:40]
         filename = f"intruder_{timestamp}.jpg"
         filepath = os.path.join(self.intruder_dir, filename)
         date_str = now.strftime("%Y-%m-%d")
         time_str = now.strftime("%H:%M:%S")
+        print(f"Intruder detected at {now.strftime('%Y-%m-%d %H:%M:%S')}")
+
+        def log_intruder(saved_path):
+            # Log the intruder detection (with no path if the image could not be stored)
+            target = "intruders" if self.event_store is not None else self.intruder_log_file
+            self.log_writer.write(target, [date_str, time_str, saved_path or ""],
+                                  header=['Date', 'Time', 'Image Path'])
+
+        if not self.snapshot_writer.save(frame, filepath, face_box, on_saved=log_intruder):
+            print("Snapshot queue full, intruder image not saved")
+            log_intruder(None)
+
+
+class LogWriter:
+    """Background thread that appends CSV log rows in batches.
+
+    Rows are queued (bounded, so a stuck disk applies back-pressure instead of
+    growing memory), grouped per file and written with one open/append per
+    batch.  Files are flushed after every batch and fsynced at most every
+    ``fsync_interval`` seconds.  on_write(path, rows, size) is called from the
+    writer thread after each CSV batch.
+
+    With an EventStore, rows queued for one of its tables (instead of a file
+    path) are inserted into it, one transaction per batch.
+    """
+
+    def __init__(self, fsync_interval=5.0, max_queue=10000, batch_size=500, on_write=None, stats=None,
+                 store=None):
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+        self.on_write = on_write
+        self.stats = stats or PipelineStats()
+        self.store = store
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.last_fsync = time.monotonic()
+        self.unsynced = set()
+        self.closed = False
+        self.thread = threading.Thread(target=self.writer_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, path, row, header=None):
+        """Queue one row for path (or store table); header is written first if the file is missing or empty."""
+        if self.closed:
+            raise RuntimeError("log writer is closed")
+        self.queue.put((path, row, header))
+
+    def flush(self):
+        """Block until every queued row has been written."""
+        self.queue.join()
+
+    def close(self):
+        """Write out queued rows, fsync and stop the writer thread."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def writer_loop(self):
+        """Collect rows into batches and write them until closed."""
+        stopping = False
+        while not stopping:
+            try:
+                items = [self.queue.get(timeout=self.fsync_interval or None)]
+            except queue.Empty:
+                self.sync()
+                continue
+
+            # Drain whatever else is already waiting, up to one batch
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if None in items:
+                stopping = True
+            start = time.perf_counter()
+            self.write_batch([item for item in items if item is not None])
+            self.stats.record("log_write", time.perf_counter() - start)
+            for _ in items:
+                self.queue.task_done()
+
+            if stopping or time.monotonic() - self.last_fsync >= self.fsync_interval:
+                self.sync()
+
+    def write_batch(self, items):
+        """Append a batch of (path, row, header) items, opening each file once."""
+        by_path = {}
+        for path, row, header in items:
+            by_path.setdefault(path, (header, []))[1].append(row)
+
+        for path, (header, rows) in by_path.items():
+            if self.store is not None and path in self.store.TABLES:
+                try:
+                    self.store.insert(path, rows)
+                except sqlite3.Error as e:
+                    print(f"Error writing to event store table {path}: {e}")
+                continue
+            try:
+                with open(path, 'a', newline='') as file:
+                    writer = csv.writer(file)
+                    if header and file.tell() == 0:
+                        writer.writerow(header)
+                    writer.writerows(rows)
+                    file.flush()
+                    size = file.tell()
+                self.unsynced.add(path)
+                if self.on_write:
+                    self.on_write(path, rows, size)
+            except Exception as e:
+                print(f"Error writing to log file {path}: {e}")
 
+    def sync(self):
+        """fsync files written since the last sync."""
+        start = time.perf_counter()
+        for path in self.unsynced:
+            try:
+                # Opened for writing: Windows refuses to fsync a read-only handle
+                fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                print(f"Error syncing log file {path}: {e}")
+        if self.store is not None:
+            try:
+                self.store.checkpoint()
+            except sqlite3.Error as e:
+                print(f"Error checkpointing event store: {e}")
+        if self.unsynced:
+            self.stats.record("log_sync", time.perf_counter() - start)
+        self.unsynced.clear()
+        self.last_fsync = time.monotonic()
+
+
+class EventStore:
+    """SQLite store for arrival and intruder events, as an alternative to the CSV logs.
+
+    The database runs in WAL mode so reports can read while the log writer
+    inserts, and is indexed by date and roll number so daily and per-student
+    queries do not scan the whole history.  Rows are inserted in batches by
+    LogWriter; existing CSV logs can be imported once and the tables exported
+    back to CSV in the original format.  One connection is shared by all
+    threads, guarded by a lock.
+    """
+
+    # Column names of each table in insert order, matching the CSV log columns
+    TABLES = {
+        "arrivals": ("log_number", "roll_no", "date", "time"),
+        "intruders": ("date", "time", "image_path"),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only syncs at checkpoints, which LogWriter runs every fsync_interval
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS arrivals (
+                    log_number INTEGER PRIMARY KEY, roll_no TEXT NOT NULL, date TEXT NOT NULL, time TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS arrivals_by_date ON arrivals (date, roll_no, time);
+                CREATE INDEX IF NOT EXISTS arrivals_by_roll_no ON arrivals (roll_no, date, time);
+                CREATE TABLE IF NOT EXISTS intruders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, time TEXT NOT NULL, image_path TEXT);
+                CREATE INDEX IF NOT EXISTS intruders_by_date ON intruders (date, time);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+
+    def insert(self, table, rows, skip_duplicates=False):
+        """Insert rows (lists in TABLES column order) into table in one transaction.
+
+        A row whose log number already exists is an error and is left out
+        (and reported) rather than replacing the stored arrival; with
+        skip_duplicates such rows are skipped silently instead.
+        """
+        columns = self.TABLES[table]
+        sql = (f"INSERT {'OR IGNORE ' if skip_duplicates else ''}INTO {table} ({', '.join(columns)}) "
+               f"VALUES ({', '.join('?' * len(columns))})")
+        with self.lock:
+            try:
+                with self.connection:
+                    self.connection.executemany(sql, rows)
+                return
+            except sqlite3.IntegrityError:
+                pass
+
+            # The batch was rolled back; insert row by row so only the conflicting rows are lost
+            for row in rows:
+                try:
+                    with self.connection:
+                        self.connection.execute(sql, row)
+                except sqlite3.IntegrityError as e:
+                    print(f"Event store rejected {table} row {row}: {e}")
+
+    def checkpoint(self):
+        """Copy the write-ahead log into the database file, syncing both to disk."""
+        with self.lock:
+            self.connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def last_log_number(self):
+        """Return the highest arrival log number (0 if there are none)."""
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(MAX(log_number), 0) FROM arrivals").fetchone()[0]
+
+    def reset(self):
+        """Delete every event; the old CSV logs are not imported again afterwards."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM arrivals")
+            self.connection.execute("DELETE FROM intruders")
+        self.mark_migrated()
+
+    def migrated(self):
+        """Check whether the CSV logs have been imported already."""
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM meta WHERE key = 'csv_imported'").fetchone() is not None
+
+    def mark_migrated(self):
+        """Record that the CSV logs have been imported (or are superseded)."""
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('csv_imported', ?)",
+                                    (datetime.now().isoformat(timespec="seconds"),))
+
+    def import_csv(self, arrival_log, intruder_log):
+        """Import existing CSV logs (skipping their headers), then mark the import as done.
+
+        Arrivals keep their log numbers, so importing the same file twice
+        does not duplicate them (rows already stored are skipped).
+        """
+        counts = {}
+        for table, path in (("arrivals", arrival_log), ("intruders", intruder_log)):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', newline='') as file:
+                rows = list(csv.reader(file))[1:]
+            if table == "arrivals":
+                rows = [row[:4] for row in rows if len(row) >= 4 and row[0].isdigit()]
+            else:
+                # Rows logged without a stored image have an empty path
+                rows = [(row + [""])[:3] for row in rows if len(row) >= 2]
+            self.insert(table, rows, skip_duplicates=True)
+            counts[table] = len(rows)
+
+        self.mark_migrated()
+        if counts:
+            print(f"Imported CSV logs into {self.path}: {counts.get('arrivals', 0)} arrivals, "
+                  f"{counts.get('intruders', 0)} intruders")
+
+    def export_csv(self, arrival_log, intruder_log):
+        """Write both tables to CSV files in the same format as the CSV logs."""
+        exports = ((arrival_log, "SELECT log_number, roll_no, date, time FROM arrivals ORDER BY log_number",
+                    ['Log No.', 'Roll no.', 'Date', 'Time']),
+                   (intruder_log, "SELECT date, time, image_path FROM intruders ORDER BY id",
+                    ['Date', 'Time', 'Image Path']))
+        with self.lock:
+            for path, sql, header in exports:
+                with open(path, 'w', newline='') as file:
+                    writer = csv.writer(file)
+                    writer.writerow(header)
+                    writer.writerows(self.connection.execute(sql))
+
+    def arrivals_on(self, date):
+        """Return (roll_no, first arrival time) of every student who arrived on date ("YYYY-MM-DD")."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT roll_no, MIN(time) FROM arrivals WHERE date = ? GROUP BY roll_no ORDER BY MIN(time)",
+                (date,)).fetchall()
+
+    def last_arrivals_on(self, date):
+        """Return (roll_no, last arrival time) of every student who arrived on date."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT roll_no, MAX(time) FROM arrivals WHERE date = ? GROUP BY roll_no", (date,)).fetchall()
+
+    def first_arrivals(self, start_date, end_date):
+        """Return (roll_no, date, first arrival time) per student and day between two dates (inclusive)."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT roll_no, date, MIN(time) FROM arrivals WHERE date BETWEEN ? AND ? "
+                "GROUP BY roll_no, date ORDER BY roll_no, date", (start_date, end_date)).fetchall()
+
+    def intruders_on(self, date):
+        """Return (time, image path) of every intruder detected on date."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT time, image_path FROM intruders WHERE date = ? ORDER BY time", (date,)).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class SnapshotWriter:
+    """Background JPEG encoding and storage of intruder snapshots.
+
+    In "full" mode the whole frame is stored, as before.  In "crop" mode the
+    face region (plus a margin) is stored together with a downscaled context
+    frame next to it (``*_context.jpg``), which is far smaller on disk.
+
+    The queue is bounded: if the disk cannot keep up, new snapshots are
+    dropped rather than stalling recognition.  After every write the oldest
+    files are deleted while the directory is over ``max_bytes`` or
+    ``max_files``, and files older than ``retention_days`` are removed; the
+    snapshot just written is never deleted.  The limits are also applied at
+    start-up and, with a retention period, hourly while no snapshots arrive.
+    """
+
+    def __init__(self, directory, mode="full", jpeg_quality=90, context_width=640, crop_margin=0.3,
+                 max_bytes=None, max_files=None, retention_days=None, max_queue=16, stats=None):
+        self.directory = directory
+        self.stats = stats or PipelineStats()
+        self.mode = mode
+        self.jpeg_quality = jpeg_quality
+        self.context_width = context_width
+        self.crop_margin = crop_margin
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.retention_days = retention_days
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self.closed = False
+
+        # Existing snapshots, oldest first, so the quota can be enforced incrementally
+        self.files = deque()
+        self.total_bytes = 0
+        self.scan_directory()
+        self.enforce_quota()
+
+        self.thread = threading.Thread(target=self.writer_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def save(self, frame, filepath, face_box=None, on_saved=None):
+        """Queue a snapshot; return False if it was dropped because the queue is full.
+
+        on_saved(path or None) is called from the writer thread once the
+        snapshot is stored (None if writing failed).
+        """
+        if self.closed:
+            return False
         try:
-            # Save the intruder image
-            cv2.imwrite(filepath, frame)
-            print(f"Intruder detected at {now.strftime('%Y-%m-%d %H:%M:%S')}")
+            self.queue.put_nowait((frame, filepath, face_box, on_saved))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self.stats.increment("snapshots_dropped")
+            return False
+
+    def close(self):
+        """Write out queued snapshots and stop the writer thread."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
 
-            # Log the intruder detection to CSV
-            with open(self.intruder_log_file, 'a', newline='') as file:
-                writer = csv.writer(file)
-                writer.writerow([date_str, time_str, filepath])
+    def writer_loop(self):
+        """Encode and store snapshots until closed."""
+        while True:
+            try:
+                item = self.queue.get(timeout=3600 if self.retention_days else None)
+            except queue.Empty:
+                # Quiet period: still expire old snapshots
+                self.enforce_quota()
+                continue
+            if item is None:
+                break
+
+            frame, filepath, face_box, on_saved = item
+            saved_path = None
+            start = time.perf_counter()
+            try:
+                written_before = self.written
+                saved_path = self.store(frame, filepath, face_box)
+                # The new files are referenced by the log row about to be written
+                self.enforce_quota(keep_newest=self.written - written_before)
+                self.stats.record("snapshot", time.perf_counter() - start)
+            except Exception as e:
+                print(f"Error saving intruder image: {e}")
+            if on_saved:
+                on_saved(saved_path)
+
+    def store(self, frame, filepath, face_box):
+        """Encode and write one snapshot, returning the path of the main image."""
+        if self.mode == "crop" and face_box is not None:
+            height, width = frame.shape[:2]
+            top, right, bottom, left = face_box
+            margin_x = int((right - left) * self.crop_margin)
+            margin_y = int((bottom - top) * self.crop_margin)
+            face = frame[max(0, top - margin_y):min(height, bottom + margin_y),
+                         max(0, left - margin_x):min(width, right + margin_x)]
+
+            scale = min(1.0, self.context_width / float(width))
+            context = cv2.resize(frame, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            self.write_jpeg(os.path.splitext(filepath)[0] + "_context.jpg", context)
+            self.write_jpeg(filepath, face)
+        else:
+            self.write_jpeg(filepath, frame)
+        return filepath
+
+    def write_jpeg(self, path, image):
+        """Encode image as JPEG at the configured quality and write it to path."""
+        ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError(f"could not encode {path}")
+        replaced = os.path.exists(path)
+        with open(path, 'wb') as file:
+            file.write(data.tobytes())
+        if replaced:
+            # An overwritten file keeps one entry, the new one
+            for entry in [entry for entry in self.files if entry[2] == path]:
+                self.files.remove(entry)
+                self.total_bytes -= entry[1]
+        self.files.append((time.time(), len(data), path))
+        self.total_bytes += len(data)
+        self.written += 1
+
+    def scan_directory(self):
+        """Index the snapshots already in the directory, oldest first."""
+        entries = []
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.lower().endswith(".jpg") and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        self.files = deque(entries)
+        self.total_bytes = sum(size for _, size, _ in entries)
+
+    def enforce_quota(self, keep_newest=0):
+        """Delete the oldest snapshots until the directory is within its limits.
+
+        The keep_newest most recent files are never deleted.
+        """
+        cutoff = time.time() - self.retention_days * 86400 if self.retention_days else None
+        while len(self.files) > keep_newest:
+            mtime, size, path = self.files[0]
+            over_bytes = self.max_bytes is not None and self.total_bytes > self.max_bytes
+            over_files = self.max_files is not None and len(self.files) > self.max_files
+            expired = cutoff is not None and mtime < cutoff
+            if not (over_bytes or over_files or expired):
+                break
+
+            self.files.popleft()
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    """Return the SHA-1 hex digest of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Result of matching one face: best identity (None if the gallery is empty),
+# its gallery row and distance, whether it is within tolerance, and the k
+# nearest (name, distance) pairs
+MatchResult = namedtuple('MatchResult', ['name', 'index', 'distance', 'is_match', 'top_k'])
+
+
+class FaceMatcher:
+    """Exact matching of face encodings against the known gallery.
+
+    The gallery may hold several templates (encodings) per identity.  Each
+    identity is summarized by the centroid of its templates, after dropping
+    outlier templates that lie more than ``outlier_distance`` from it.  Faces
+    are first compared with all centroids in one matrix product
+    (|q - g|^2 = |q|^2 + |g|^2 - 2 q.g on contiguous float32 arrays with
+    precomputed norms), then refined against the templates of the
+    ``shortlist`` closest identities only.  An identity's distance is that of
+    its nearest template, so extra templates improve accuracy without
+    multiplying the matching cost.  With one template per identity this is
+    plain exact nearest-neighbour search.
+    """
+
+    def __init__(self, encodings, names, tolerance=0.6, shortlist=5, outlier_distance=0.5):
+        self.tolerance = tolerance
+        self.shortlist = shortlist
+        templates = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+
+        # Group templates by identity, keeping identities in first-seen order
+        identities = {}
+        owners = np.array([identities.setdefault(name, len(identities)) for name in names], dtype=np.int64)
+        self.names = list(identities)
+        order = np.argsort(owners, kind='stable')
+        self.templates = np.ascontiguousarray(templates[order])
+        self.owners = owners[order]
+        # Row of each template in the encodings passed in
+        self.rows = order
+
+        self.pruned = self.prune_outliers(outlier_distance) if len(self.templates) else 0
+        self.template_norms_sq = np.einsum('ij,ij->i', self.templates, self.templates)
+        self.centroids = self.identity_means()
+        self.centroid_norms_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def template_count(self):
+        return len(self.templates)
+
+    @property
+    def nbytes(self):
+        """Memory held by the gallery arrays used for matching."""
+        return sum(array.nbytes for array in (self.templates, self.template_norms_sq, self.centroids,
+                                              self.centroid_norms_sq, self.owners, self.offsets, self.rows))
+
+    def identity_means(self):
+        """Set the per-identity template offsets and return each identity's mean template."""
+        counts = np.bincount(self.owners, minlength=len(self.names))
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        if len(self.templates) == 0:
+            return np.empty((0, 128), dtype=np.float32)
+        sums = np.add.reduceat(self.templates, self.offsets[:-1], axis=0)
+        return np.ascontiguousarray(sums / counts[:, None], dtype=np.float32)
+
+    def prune_outliers(self, outlier_distance, passes=2):
+        """Drop templates far from their identity's centroid; return how many were dropped.
+
+        Only identities with at least three templates are pruned, and at
+        least half of each identity's templates are always kept.  The
+        centroid is recomputed from the kept templates and the test repeated,
+        so a single wild template cannot drag the centroid away from the rest.
+        """
+        self.identity_means()
+        counts = np.diff(self.offsets)
+        keep = np.ones(len(self.templates), dtype=bool)
+        for _ in range(passes):
+            kept = np.bincount(self.owners[keep], minlength=len(self.names))
+            sums = np.add.reduceat(self.templates * keep[:, None], self.offsets[:-1], axis=0)
+            centroids = sums / kept[:, None]
+            distances = np.linalg.norm(self.templates - centroids[self.owners], axis=1)
+            keep = (distances <= outlier_distance) | (counts[self.owners] < 3)
+
+            # Identities where the threshold would remove too much keep their closest half instead
+            kept = np.bincount(self.owners[keep], minlength=len(self.names))
+            for identity in np.flatnonzero(kept < (counts + 1) // 2):
+                start, end = self.offsets[identity], self.offsets[identity + 1]
+                closest = start + np.argsort(distances[start:end])[:(counts[identity] + 1) // 2]
+                keep[start:end] = False
+                keep[closest] = True
+
+        self.templates = np.ascontiguousarray(self.templates[keep])
+        self.owners = self.owners[keep]
+        self.rows = self.rows[keep]
+        return int(len(keep) - keep.sum())
+
+    def centroid_distances_sq(self, queries, identities=None):
+        """Squared distances from queries to all (or the given) identity centroids."""
+        queries_sq = np.einsum('ij,ij->i', queries, queries)
+        if identities is None:
+            return queries_sq[:, None] + self.centroid_norms_sq[None, :] - 2 * (queries @ self.centroids.T)
+        return queries_sq[:, None] + self.centroid_norms_sq[identities] - 2 * (queries @ self.centroids[identities].T)
+
+    def candidates(self, queries, count):
+        """Return, per query, the indices of the count identities with the closest centroids."""
+        distances_sq = self.centroid_distances_sq(queries)
+        if count >= len(self.names):
+            return [np.arange(len(self.names))] * len(queries)
+        return list(np.argpartition(distances_sq, count - 1, axis=1)[:, :count])
+
+    def refine(self, query, identities):
+        """Distance from query to the nearest template of each given identity."""
+        starts = self.offsets[identities]
+        counts = self.offsets[identities + 1] - starts
+        # Row indices of all templates of the candidate identities, in identity order
+        group_starts = np.cumsum(counts) - counts
+        rows = np.repeat(starts - group_starts, counts) + np.arange(counts.sum())
+
+        distances_sq = query @ query + self.template_norms_sq[rows] - 2 * (self.templates[rows] @ query)
+        distances = np.sqrt(np.maximum(distances_sq, 0))
+        return np.minimum.reduceat(distances, group_starts)
+
+    def match(self, face_encodings, k=1):
+        """Match a batch of face encodings, returning one MatchResult per face.
+
+        MatchResult.index is the identity's position in ``names``.
+        """
+        if len(face_encodings) == 0:
+            return []
+        if not self.names:
+            return [MatchResult(None, -1, float("inf"), False, []) for _ in face_encodings]
+
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+        results = []
+        for query, identities in zip(queries, self.candidates(queries, max(self.shortlist, k))):
+            if len(identities) == 0:
+                results.append(MatchResult(None, -1, float("inf"), False, []))
+                continue
+
+            distances = self.refine(query, identities)
+            nearest = np.argsort(distances)[:k]
+            best = int(identities[nearest[0]])
+            best_distance = float(distances[nearest[0]])
+            top_k = [(self.names[identities[i]], float(distances[i])) for i in nearest]
+            results.append(MatchResult(self.names[best], best, best_distance,
+                                       best_distance <= self.tolerance, top_k))
+        return results
+
+
+def quantize(vectors, precision):
+    """Return (compact vectors, per-vector scales) for "float16" or "int8" storage.
+
+    int8 stores round(v / s) with s = max|v| / 127 for each vector; float16
+    needs no scales (None).
+    """
+    if precision == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0 if len(vectors) else np.empty(0)
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def dequantize(vectors, scales):
+    """Return float32 vectors from quantize() output."""
+    if scales is None:
+        return vectors.astype(np.float32)
+    return vectors.astype(np.float32) * scales[:, None]
+
+
+class CompactFaceMatcher(FaceMatcher):
+    """Matcher that keeps the gallery in float16, or int8 with a scale per vector.
+
+    Centroids and templates take 2x (float16) or ~4x (int8) less memory than
+    float32.  The centroid search and template refinement run on the compact
+    form, dequantizing ``chunk_size`` rows at a time so no full-precision
+    copy of the gallery is ever built.  The ``rerank`` nearest identities are
+    then re-scored exactly against the original encodings, normally the
+    float64 matrix memory-mapped from the encoding cache, of which only the
+    few rows touched are paged in.
+    """
+
+    def __init__(self, encodings, names, tolerance=0.6, precision="int8", rerank=3, chunk_size=4096, **options):
+        super().__init__(encodings, names, tolerance, **options)
+        self.precision = precision
+        self.rerank = rerank
+        self.chunk_size = chunk_size
+        self.source = np.asarray(encodings).reshape(-1, 128)
+        self.centroid_scales = self.template_scales = None
+        self.float32_nbytes = self.nbytes
+
+        self.centroids, self.centroid_scales = quantize(self.centroids, precision)
+        self.templates, self.template_scales = quantize(self.templates, precision)
+        # Norms of the dequantized vectors, so the expanded distance formula stays consistent
+        self.centroid_norms_sq = self.norms_sq(self.centroids, self.centroid_scales)
+        self.template_norms_sq = self.norms_sq(self.templates, self.template_scales)
+
+    @property
+    def nbytes(self):
+        scales = [scale for scale in (self.centroid_scales, self.template_scales) if scale is not None]
+        return super().nbytes + sum(scale.nbytes for scale in scales)
+
+    def dequantized(self, vectors, scales, rows=None):
+        """Yield (start, float32 block) over the given rows (default: all) in chunks."""
+        count = len(vectors) if rows is None else len(rows)
+        for start in range(0, count, self.chunk_size):
+            selected = slice(start, start + self.chunk_size) if rows is None else rows[start:start + self.chunk_size]
+            yield start, dequantize(vectors[selected], None if scales is None else scales[selected])
+
+    def norms_sq(self, vectors, scales):
+        norms = np.empty(len(vectors), dtype=np.float32)
+        for start, block in self.dequantized(vectors, scales):
+            norms[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+        return norms
+
+    def centroid_distances_sq(self, queries, identities=None):
+        """Squared distances from queries to all (or the given) identity centroids, from the compact form."""
+        queries_sq = np.einsum('ij,ij->i', queries, queries)
+        norms_sq = self.centroid_norms_sq if identities is None else self.centroid_norms_sq[identities]
+        products = np.empty((len(queries), len(norms_sq)), dtype=np.float32)
+        for start, block in self.dequantized(self.centroids, self.centroid_scales, identities):
+            products[:, start:start + len(block)] = queries @ block.T
+        return queries_sq[:, None] + norms_sq[None, :] - 2 * products
+
+    def refine(self, query, identities):
+        """Approximate distance to each identity's nearest template, exact for the nearest few."""
+        starts = self.offsets[identities]
+        counts = self.offsets[identities + 1] - starts
+        group_starts = np.cumsum(counts) - counts
+        rows = np.repeat(starts - group_starts, counts) + np.arange(counts.sum())
+
+        templates = dequantize(self.templates[rows], None if self.template_scales is None
+                               else self.template_scales[rows])
+        distances_sq = query @ query + self.template_norms_sq[rows] - 2 * (templates @ query)
+        distances = np.minimum.reduceat(np.sqrt(np.maximum(distances_sq, 0)), group_starts)
+
+        # Re-rank the closest identities in full precision
+        for i in np.argsort(distances)[:self.rerank]:
+            start, end = starts[i], starts[i] + counts[i]
+            exact = np.asarray(self.source[self.rows[start:end]], dtype=np.float64) - query
+            distances[i] = np.sqrt(np.einsum('ij,ij->i', exact, exact).min())
+        return distances
+
+
+def nearest_centroids(data, centroids, chunk_size=8192):
+    """Return the index of the nearest centroid for every row of data."""
+    centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+    assignment = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk_size):
+        chunk = data[start:start + chunk_size]
+        # |x|^2 is constant per row, so it can be left out of the argmin
+        assignment[start:start + chunk_size] = np.argmin(centroid_sq[None, :] - 2 * (chunk @ centroids.T), axis=1)
+    return assignment
+
+
+def kmeans(data, n_clusters, iterations=10, seed=0):
+    """Plain Lloyd's k-means; empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = nearest_centroids(data, centroids)
+        counts = np.bincount(assignment, minlength=n_clusters)
+
+        # Sum members per cluster with one sort + reduceat instead of a Python loop
+        order = np.argsort(assignment, kind='stable')
+        occupied = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[occupied])[:-1]))
+        centroids[occupied] = np.add.reduceat(data[order], starts, axis=0) / counts[occupied, None]
+
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+
+    return centroids
+
+
+class IVFFaceMatcher(FaceMatcher):
+    """Approximate matcher for large galleries using an inverted-file (IVF) index.
+
+    The identity centroids are partitioned into roughly sqrt(N) k-means
+    cells.  A query is compared with the cell centroids and then only with
+    the identity centroids in the ``nprobe`` nearest cells before the usual
+    template refinement.  Raising nprobe trades speed for recall; nprobe >=
+    number of cells is an exact search.
+    """
+
+    def __init__(self, encodings, names, tolerance=0.6, nprobe=8, n_lists=None, training_size=50000, **options):
+        super().__init__(encodings, names, tolerance, **options)
+        self.nprobe = nprobe
+
+        count = len(self.names)
+        self.n_lists = max(1, min(n_lists or int(np.sqrt(count)), count))
+        if count == 0:
+            self.cells = np.empty((0, 128), dtype=np.float32)
+            self.lists = []
+            return
 
+        # Train on a sample: cells from 50k points are as good as from all of them
+        training = self.centroids
+        if count > training_size:
+            sample = np.random.default_rng(0).choice(count, training_size, replace=False)
+            training = self.centroids[sample]
+        self.cells = kmeans(training, self.n_lists)
+
+        assignment = nearest_centroids(self.centroids, self.cells)
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.cumsum(np.bincount(assignment, minlength=self.n_lists))[:-1]
+        self.lists = np.split(order, bounds)
+
+    def candidates(self, queries, count):
+        """Return, per query, the closest identities among those in the nprobe nearest cells."""
+        nprobe = min(self.nprobe, self.n_lists)
+        cell_distances = np.einsum('ij,ij->i', self.cells, self.cells)[None, :] - 2 * (queries @ self.cells.T)
+        probed = np.argpartition(cell_distances, nprobe - 1, axis=1)[:, :nprobe]
+
+        results = []
+        for query, cells in zip(queries, probed):
+            members = np.concatenate([self.lists[cell] for cell in cells])
+            if len(members) > count:
+                distances_sq = self.centroid_distances_sq(query[None, :], members)[0]
+                members = members[np.argpartition(distances_sq, count - 1)[:count]]
+            results.append(members)
+        return results
+
+
+# Enrollment outcomes for a single image
+ENROLL_OK = "ok"
+ENROLL_NO_FACE = "no_face"
+ENROLL_MULTIPLE_FACES = "multiple_faces"
+ENROLL_UNREADABLE = "unreadable"
+
+ENROLL_MESSAGES = {
+    ENROLL_OK: "Loaded",
+    ENROLL_NO_FACE: "No face found",
+    ENROLL_MULTIPLE_FACES: "Multiple faces found",
+    ENROLL_UNREADABLE: "Unreadable image",
+}
+
+EnrollmentSummary = namedtuple('EnrollmentSummary', ['total', 'loaded', 'identities', 'pruned', 'cached', 'encoded',
+                                                     'failures'])
+
+
+def lower_process_priority():
+    """Run the current (worker) process at low CPU priority where the OS allows it."""
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def encode_face_image(image_path):
+    """Hash, decode and encode one enrollment image.
+
+    Runs inside enrollment worker processes, so it only returns plain data:
+    (status, encoding or None, sha1 or None).
+    """
+    try:
+        digest = file_sha1(image_path)
+    except OSError:
+        return ENROLL_UNREADABLE, None, None
+
+    try:
+        image = face_recognition.load_image_file(image_path)
+    except Exception:
+        return ENROLL_UNREADABLE, None, digest
+
+    encodings = face_recognition.face_encodings(image)
+    if not encodings:
+        return ENROLL_NO_FACE, None, digest
+    if len(encodings) > 1:
+        # Ambiguous enrollment photo: we can't tell which face is the student
+        return ENROLL_MULTIPLE_FACES, None, digest
+    return ENROLL_OK, encodings[0], digest
+
+
+# One cached image: where it lives, who it is, its fingerprint and its encoding
+# (None if no face could be found in it)
+CacheRecord = namedtuple('CacheRecord', ['path', 'name', 'size', 'mtime', 'sha1', 'encoding', 'status'])
+
+
+class EncodingCache:
+    """Persistent store of known face encodings.
+
+    Encodings live in a single (N, 128) .npy matrix that is memory-mapped on
+    load, with a JSON index mapping each image path to its row.  An entry is
+    reused while the file's size and mtime are unchanged, or when they changed
+    but the content hash still matches (e.g. the file was copied or touched).
+
+    Every save writes a new matrix file and then atomically replaces the
+    index, so the index is the single commit point and a matrix that is still
+    memory-mapped is never overwritten.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.index_file = os.path.join(cache_dir, "encodings_index.json")
+        self.matrix_file = None
+        self.entries = {}
+        self.matrix = np.empty((0, 128))
+
+    def load(self):
+        """Load the index and memory-map the encoding matrix, discarding a corrupt cache."""
+        self.entries = {}
+        self.matrix = np.empty((0, 128))
+        self.matrix_file = None
+        if not os.path.exists(self.index_file):
+            return
+
+        try:
+            with open(self.index_file, 'r') as file:
+                index = json.load(file)
+            matrix_file = os.path.join(self.cache_dir, index["matrix"])
+            matrix = np.load(matrix_file, mmap_mode='r')
+
+            entries = {}
+            for entry in index.get("entries", []):
+                row = entry.get("row")
+                if row is not None and not 0 <= row < len(matrix):
+                    raise ValueError(f"row {row} out of range for {entry.get('path')}")
+                entries[entry["path"]] = entry
+
+            self.entries = entries
+            self.matrix = matrix
+            self.matrix_file = matrix_file
+            print(f"Loaded encoding cache with {len(matrix)} encodings")
+        except Exception as e:
+            print(f"Error reading encoding cache, rebuilding: {e}")
+
+    def lookup(self, path, stat):
+        """Return a CacheRecord for an unchanged image, or None if it must be re-encoded."""
+        entry = self.entries.get(path)
+        if entry is None or entry["size"] != stat.st_size:
+            return None
+
+        if entry["mtime"] != stat.st_mtime_ns:
+            # Same size but touched: only trust the cache if the content is identical
+            if file_sha1(path) != entry["sha1"]:
+                return None
+
+        row = entry["row"]
+        encoding = self.matrix[row] if row is not None else None
+        return CacheRecord(path, entry["name"], stat.st_size, stat.st_mtime_ns, entry["sha1"], encoding,
+                           entry.get("status", ENROLL_OK if encoding is not None else ENROLL_NO_FACE))
+
+    def update(self, records):
+        """Persist the given records and return the matrix of their encodings.
+
+        If the records are exactly what is already stored the existing
+        memory-mapped matrix is returned without touching the disk.
+        """
+        if self._unchanged(records):
+            return self.matrix
+
+        encoded = [record for record in records if record.encoding is not None]
+        matrix = np.array([record.encoding for record in encoded], dtype=np.float64).reshape(-1, 128)
+
+        entries = []
+        row = 0
+        for record in records:
+            entries.append({
+                "path": record.path,
+                "name": record.name,
+                "size": record.size,
+                "mtime": record.mtime,
+                "sha1": record.sha1,
+                "row": row if record.encoding is not None else None,
+                "status": record.status,
+            })
+            if record.encoding is not None:
+                row += 1
+
+        matrix_name = f"encodings_{time.time_ns()}.npy"
+        try:
+            with open(os.path.join(self.cache_dir, matrix_name), 'wb') as file:
+                np.save(file, matrix)
+            with open(self.index_file + ".tmp", 'w') as file:
+                json.dump({"version": 1, "matrix": matrix_name, "entries": entries}, file)
+            os.replace(self.index_file + ".tmp", self.index_file)
+            print(f"Saved encoding cache with {len(matrix)} encodings")
+        except Exception as e:
+            print(f"Error saving encoding cache: {e}")
+            return matrix
+
+        self.load()
+        self._remove_stale_matrices(matrix_name)
+        return self.matrix
+
+    def _remove_stale_matrices(self, current):
+        """Delete matrix files left behind by earlier saves."""
+        for filename in os.listdir(self.cache_dir):
+            if filename.startswith("encodings_") and filename.endswith(".npy") and filename != current:
+                try:
+                    os.remove(os.path.join(self.cache_dir, filename))
+                except OSError:
+                    # Still memory-mapped somewhere (Windows); it will be removed on a later save
+                    pass
+
+    def _unchanged(self, records):
+        """Check whether records match the stored index entry for entry."""
+        if len(records) != len(self.entries):
+            return False
+
+        for record in records:
+            entry = self.entries.get(record.path)
+            if entry is None or (entry["name"], entry["size"], entry["mtime"], entry["sha1"], entry.get("status")) != (
+                    record.name, record.size, record.mtime, record.sha1, record.status):
+                return False
+            if (entry["row"] is None) != (record.encoding is None):
+                return False
+
+        # Rows must also come out in the same order as the stored matrix
+        rows = [self.entries[record.path]["row"] for record in records if record.encoding is not None]
+        return rows == list(range(len(self.matrix)))
+
+
+class GalleryWatcher:
+    """Poll known_faces/ and hot-reload the gallery when images are added, changed or removed.
+
+    Polling only stats files; on a change the system re-enrolls at low
+    priority, which re-encodes just the affected images (everything else
+    comes from the encoding cache) and swaps in the new matcher.
+    """
+
+    def __init__(self, system, interval=5.0, on_reload=None):
+        self.system = system
+        self.interval = interval
+        self.on_reload = on_reload
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.watch_loop)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def watch_loop(self):
+        """Check for changes every interval seconds until stopped."""
+        while not self.stop_event.wait(self.interval):
+            try:
+                if not self.system.gallery_changed():
+                    continue
+                print("Known faces changed, reloading...")
+                self.system.load_known_faces(low_priority=True)
+                if self.on_reload:
+                    self.on_reload(self.system.enrollment_summary)
+            except Exception as e:
+                print(f"Error reloading known faces: {e}")
+
+
+class PipelineStats:
+    """Thread-safe per-stage latency and counter bookkeeping for a recognition pipeline.
+
+    Latencies are kept as exponential moving averages so reading them is O(1)
+    from any thread, plus the last ``window`` samples of every stage from
+    which percentiles are computed on demand.
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, smoothing=0.1, window=500):
+        self.smoothing = smoothing
+        self.window = window
+        self.latencies = {}
+        self.samples = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        """Record one latency sample for a stage."""
+        with self.lock:
+            previous = self.latencies.get(stage)
+            if previous is None:
+                self.latencies[stage] = seconds
+                self.samples[stage] = deque(maxlen=self.window)
+            else:
+                self.latencies[stage] = previous + self.smoothing * (seconds - previous)
+            self.samples[stage].append(seconds)
+        self.increment(f"{stage}_count")
+
+    def increment(self, counter, amount=1):
+        """Add to a running counter."""
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def set_gauge(self, name, value):
+        """Set an instantaneous value such as a queue depth."""
+        with self.lock:
+            self.gauges[name] = value
+
+    def latency_ms(self, stage):
+        """Return the smoothed latency of a stage in milliseconds (0 if never recorded)."""
+        with self.lock:
+            return self.latencies.get(stage, 0.0) * 1000
+
+    def percentiles_ms(self):
+        """Return {stage: {"p50": ms, "p90": ms, "p99": ms}} over each stage's recent samples."""
+        with self.lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+        return {stage: dict(zip((f"p{p}" for p in self.PERCENTILES),
+                                (np.percentile(values, self.PERCENTILES) * 1000).tolist()))
+                for stage, values in samples.items()}
+
+    def snapshot(self):
+        """Return a copy of all latencies (ms), latency percentiles (ms), counters and gauges."""
+        percentiles = self.percentiles_ms()
+        with self.lock:
+            return {
+                "latency_ms": {stage: value * 1000 for stage, value in self.latencies.items()},
+                "percentiles_ms": percentiles,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def summary(self):
+        """Return a one-line human readable summary."""
+        snapshot = self.snapshot()
+        latencies = ", ".join(f"{stage} {value:.1f}ms" for stage, value in sorted(snapshot["latency_ms"].items()))
+        counters = ", ".join(f"{name} {value}" for name, value in sorted(snapshot["counters"].items())
+                             if not name.endswith("_count"))
+        return f"{latencies}; {counters}"
+
+    def overlay_text(self):
+        """Return the short pipeline status lines drawn on the video."""
+        with self.lock:
+            dropped = self.counters.get("recognition_dropped", 0)
+            backlog = self.gauges.get("recognition_backlog", 0)
+            settings = self.gauges.get("detect_settings")
+            fps = self.gauges.get("recognition_fps", 0.0)
+        lines = [f"Recog: {self.latency_ms('recognize'):.0f}ms  Backlog: {backlog}  Dropped: {dropped}"]
+        if settings:
+            lines.append(f"Detect: {settings}  {fps:.1f} fps")
+        return lines
+
+    def panel_text(self):
+        """Return a multi-line per-stage table of counts and p50/p90/p99 latencies."""
+        snapshot = self.snapshot()
+        counters = snapshot["counters"]
+        lines = [f"{'stage':<9}{'n':>7}{'p50':>7}{'p90':>7}{'p99':>7}"]
+        for stage, values in sorted(snapshot["percentiles_ms"].items()):
+            lines.append(f"{stage:<9}{counters.get(stage + '_count', 0):>7}"
+                         + "".join(f"{values[f'p{p}']:>7.1f}" for p in self.PERCENTILES))
+        extra = ", ".join(f"{name} {value}" for name, value in sorted(counters.items())
+                          if not name.endswith("_count"))
+        if extra:
+            lines.append(extra)
+        return "\n".join(lines)
+
+
+class StatsDumper:
+    """Periodically append pipeline stats to a CSV or JSON-lines file.
+
+    ``get_stats`` returns {name: PipelineStats} for everything to dump (it is
+    called on every dump, so pipelines may come and go).  CSV rows are in
+    long form (Timestamp, Host, Source, Metric, Value), one row per latency
+    percentile, counter and numeric gauge; JSON lines hold one full snapshot
+    per source per dump.  The host name is included so files from several
+    machines can be compared.
+    """
+
+    def __init__(self, get_stats, path, interval=60.0, file_format="csv"):
+        self.get_stats = get_stats
+        self.path = path
+        self.interval = interval
+        self.file_format = file_format
+        self.host = platform.node()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.dump_loop)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """Stop the dump thread after writing one last dump."""
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=2)
+
+    def dump_loop(self):
+        """Dump every interval seconds, and once more when stopped."""
+        while not self.stop_event.wait(self.interval):
+            self.dump()
+        self.dump()
+
+    def dump(self):
+        """Append the current stats of every source to the file."""
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        try:
+            snapshots = {name: stats.snapshot() for name, stats in self.get_stats().items()}
+            if not snapshots:
+                return
+            if self.file_format == "json":
+                with open(self.path, 'a') as file:
+                    for name, snapshot in snapshots.items():
+                        file.write(json.dumps({"timestamp": timestamp, "host": self.host, "source": name,
+                                               **snapshot}) + "\n")
+                return
+
+            rows = []
+            for name, snapshot in snapshots.items():
+                for stage, values in sorted(snapshot["percentiles_ms"].items()):
+                    rows.extend([timestamp, self.host, name, f"{stage}.{key}_ms", f"{value:.3f}"]
+                                for key, value in values.items())
+                rows.extend([timestamp, self.host, name, counter, value]
+                            for counter, value in sorted(snapshot["counters"].items()))
+                rows.extend([timestamp, self.host, name, gauge, value]
+                            for gauge, value in sorted(snapshot["gauges"].items())
+                            if isinstance(value, (int, float)))
+            with open(self.path, 'a', newline='') as file:
+                writer = csv.writer(file)
+                if file.tell() == 0:
+                    writer.writerow(['Timestamp', 'Host', 'Source', 'Metric', 'Value'])
+                writer.writerows(rows)
         except Exception as e:
-            print(f"Error saving intruder image or log: {e}")
+            print(f"Error writing performance stats to {self.path}: {e}")
+
+
+class FrameSource:
+    """Capture thread that always holds the latest frame from a video source.
+
+    Consumers never queue up behind the camera: read_latest() hands out the
+    newest frame, and any frames a consumer did not get to in time are simply
+    skipped (consumers can count them from the gap in sequence numbers).
+    """
+
+    def __init__(self, source, stats=None, realtime=True):
+        self.source = source
+        self.stats = stats or PipelineStats()
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        # Video files are read at their own frame rate unless realtime is False
+        self.realtime = realtime and self.is_file
+        self.video_capture = None
+        self.thread = None
+        self.running = False
+        self.failed = False
+        self.condition = threading.Condition()
+        self.seq = -1
+        self.frame = None
+        self.timestamp = 0
+
+    def start(self):
+        """Open the source and start capturing; return False if it could not be opened."""
+        self.video_capture = cv2.VideoCapture(self.source)
+        if not self.video_capture.isOpened():
+            return False
+
+        self.running = True
+        self.thread = threading.Thread(target=self.capture_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop capturing and release the source."""
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+
+    def capture_loop(self):
+        """Read frames as fast as the source delivers them, keeping only the newest."""
+        fps = self.video_capture.get(cv2.CAP_PROP_FPS) if self.realtime else 0
+        frame_interval = 1.0 / fps if fps and fps > 0 else 0
+        next_frame_time = time.perf_counter()
+
+        while self.running:
+            start = time.perf_counter()
+            ret, frame = self.video_capture.read()
+            if not ret:
+                # A camera that stops delivering has failed; a file has simply ended
+                self.failed = not self.is_file
+                break
+            self.stats.record("capture", time.perf_counter() - start)
+
+            if frame_interval:
+                # Play files back like a live camera would deliver them
+                next_frame_time += frame_interval
+                delay = next_frame_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            with self.condition:
+                self.seq += 1
+                self.frame = frame
+                self.timestamp = time.time()
+                self.condition.notify_all()
+
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        self.video_capture.release()
+
+    def read_latest(self, after_seq=-1, timeout=None):
+        """Return (seq, frame, timestamp) for the newest frame newer than after_seq.
+
+        Blocks up to timeout seconds for such a frame; returns None on timeout
+        or once capture has stopped.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > after_seq or not self.running, timeout):
+                return None
+            if self.seq <= after_seq:
+                return None
+            return self.seq, self.frame, self.timestamp
+
+
+# One face in a processed frame; box is (top, right, bottom, left) in full-frame pixels,
+# track_id identifies the same face across frames when tracking is enabled
+FaceResult = namedtuple('FaceResult', ['box', 'name', 'confidence', 'is_known', 'track_id'], defaults=(None,))
+
+# The recognition output for one frame; processing is True while in the post-event cooldown
+RecognitionResult = namedtuple('RecognitionResult', ['seq', 'faces', 'processing', 'timestamp'])
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    if intersection == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return intersection / float(area_a + area_b - intersection)
+
+
+class FaceTrack:
+    """A face followed across frames, carrying its last known identity."""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.name = "Unknown"
+        self.confidence = 0
+        self.distance = float("inf")
+        self.is_known = False
+        self.encoded_at = None
+        self.misses = 0
+        self.points = None
+
+    def identify(self, match, detection_index):
+        """Store the identity from a fresh encoding + match."""
+        self.encoded_at = detection_index
+        self.distance = match.distance
+        self.is_known = match.is_match
+        self.name = match.name if match.is_match else "Unknown"
+        self.confidence = (1 - match.distance) * 100 if match.is_match else 0
+
+    def result(self):
+        return FaceResult(self.box, self.name, self.confidence, self.is_known, self.track_id)
+
+
+class FaceTracker:
+    """Carry face identities across frames so faces are not re-encoded every frame.
+
+    Detections are associated with existing tracks by greedy IoU matching.
+    A track only needs encoding when it is new, not confidently known, or its
+    identity has not been re-verified for ``reencode_interval`` detections
+    (``present_reencode_interval`` for students is_present() says have
+    already arrived, who only need drawing).
+    Tracks missing from ``max_misses`` consecutive detections are dropped.
+    Between detections, boxes either stay put or, with optical flow enabled,
+    follow the median Lucas-Kanade motion of feature points inside them.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_misses=2, reencode_interval=10, confident_distance=0.45,
+                 use_optical_flow=False, flow_width=320, is_present=None, present_reencode_interval=40):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.reencode_interval = reencode_interval
+        self.is_present = is_present
+        self.present_reencode_interval = present_reencode_interval
+        self.confident_distance = confident_distance
+        self.use_optical_flow = use_optical_flow
+        self.flow_width = flow_width
+        self.tracks = []
+        self.next_id = 0
+        self.detections = 0
+        self.prev_gray = None
+        self.flow_scale = 1.0
+
+    def needs_encoding(self, track):
+        """Check whether a track's identity must be (re-)established from an encoding."""
+        if track.encoded_at is None or not track.is_known:
+            return True
+        if track.distance > self.confident_distance:
+            return True
+        interval = self.reencode_interval
+        if self.is_present is not None and self.is_present(track.name):
+            interval = self.present_reencode_interval
+        return self.detections - track.encoded_at >= interval
+
+    def associate(self, boxes, frame):
+        """Match detected boxes to tracks, returning the track for each box in order."""
+        self.detections += 1
+        pairs = sorted(((box_iou(track.box, box), t, b) for t, track in enumerate(self.tracks)
+                        for b, box in enumerate(boxes)), reverse=True)
+
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for iou, t, b in pairs:
+            if iou < self.iou_threshold:
+                break
+            if t in used_tracks or assigned[b] is not None:
+                continue
+            assigned[b] = self.tracks[t]
+            used_tracks.add(t)
+
+        # Age out tracks that were not seen in this detection
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t in used_tracks:
+                track.misses = 0
+                survivors.append(track)
+            else:
+                track.misses += 1
+                if track.misses <= self.max_misses:
+                    survivors.append(track)
+
+        for b, box in enumerate(boxes):
+            if assigned[b] is None:
+                assigned[b] = FaceTrack(self.next_id, box)
+                self.next_id += 1
+                survivors.append(assigned[b])
+            else:
+                assigned[b].box = box
+        self.tracks = survivors
+
+        if self.use_optical_flow:
+            self.prev_gray = self._gray(frame)
+            for track in self.tracks:
+                track.points = self._features(track.box)
+        return assigned
+
+    def predict(self, frame):
+        """Return the tracked faces for a frame that is not run through detection."""
+        if self.use_optical_flow and self.prev_gray is not None:
+            gray = self._gray(frame)
+            for track in self.tracks:
+                if track.points is None or len(track.points) < 3:
+                    continue
+                moved, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, track.points, None)
+                good = status.ravel() == 1
+                if good.sum() < 3:
+                    continue
+                dx, dy = np.median((moved[good] - track.points[good]).reshape(-1, 2), axis=0) / self.flow_scale
+                top, right, bottom, left = track.box
+                track.box = (int(top + dy), int(right + dx), int(bottom + dy), int(left + dx))
+                track.points = moved[good].reshape(-1, 1, 2)
+            self.prev_gray = gray
+
+        return [track.result() for track in self.tracks if track.misses == 0]
+
+    def _gray(self, frame):
+        """Downscaled grayscale copy of a frame for optical flow."""
+        self.flow_scale = min(1.0, self.flow_width / float(frame.shape[1]))
+        small = cv2.resize(frame, (0, 0), fx=self.flow_scale, fy=self.flow_scale)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def _features(self, box):
+        """Corner features inside a box of the previous grayscale frame."""
+        top, right, bottom, left = (int(value * self.flow_scale) for value in box)
+        mask = np.zeros_like(self.prev_gray)
+        mask[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)] = 255
+        return cv2.goodFeaturesToTrack(self.prev_gray, maxCorners=20, qualityLevel=0.01, minDistance=3, mask=mask)
+
+
+def parse_source(text):
+    """Turn a command-line source into what cv2.VideoCapture expects (device index or path/URL)."""
+    return int(text) if text.isdigit() else text
+
+
+def detect_faces(rgb_image, upsample=1):
+    """Return face locations in an RGB image (module level so worker processes can run it)."""
+    return face_recognition.face_locations(rgb_image, number_of_times_to_upsample=upsample)
+
+
+def encode_faces(rgb_image, face_locations):
+    """Return encodings for the given face locations (module level so worker processes can run it)."""
+    return face_recognition.face_encodings(rgb_image, face_locations)
+
+
+def detect_and_encode_faces(rgb_image):
+    """Return (face locations, encodings) in one worker round trip."""
+    face_locations = face_recognition.face_locations(rgb_image)
+    return face_locations, face_recognition.face_encodings(rgb_image, face_locations)
+
+
+class RegionOfInterest:
+    """One or more polygons, in fractions of the frame size, where faces are looked for.
+
+    Fractions (0-1) keep the same ROI valid whatever the camera resolution.
+    Pixel masks and bounds are computed once per frame size.
+    """
+
+    def __init__(self, polygons):
+        self.polygons = [np.array(polygon, dtype=np.float32).reshape(-1, 2) for polygon in polygons]
+        self.cache = {}
+
+    @staticmethod
+    def parse(text):
+        """Parse one polygon from "x,y x,y x,y ..." with fractional coordinates."""
+        points = [tuple(float(value) for value in point.split(",")) for point in text.split()]
+        if len(points) < 3 or any(len(point) != 2 for point in points):
+            raise argparse.ArgumentTypeError(f"ROI needs at least three x,y points: {text!r}")
+        if not all(0 <= value <= 1 for point in points for value in point):
+            raise argparse.ArgumentTypeError(f"ROI coordinates must be fractions between 0 and 1: {text!r}")
+        xs, ys = zip(*points)
+        area = sum(xs[i - 1] * ys[i] - xs[i] * ys[i - 1] for i in range(len(points))) / 2
+        if area == 0:
+            raise argparse.ArgumentTypeError(f"ROI polygon has no area: {text!r}")
+        return points
+
+    def pixel_polygons(self, width, height):
+        """The polygons scaled to a frame size, as int32 point arrays."""
+        key = ("polygons", width, height)
+        if key not in self.cache:
+            self.cache[key] = [np.round(polygon * (width, height)).astype(np.int32) for polygon in self.polygons]
+        return self.cache[key]
+
+    def mask(self, width, height):
+        """uint8 mask (255 inside the ROI) for a frame size."""
+        key = ("mask", width, height)
+        if key not in self.cache:
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(mask, self.pixel_polygons(width, height), 255)
+            self.cache[key] = mask
+        return self.cache[key]
+
+    def bounds(self, width, height):
+        """(left, top, right, bottom) pixel bounding box of all polygons."""
+        key = ("bounds", width, height)
+        if key not in self.cache:
+            points = np.concatenate(self.pixel_polygons(width, height))
+            left, top = np.clip(points.min(axis=0), 0, (width - 1, height - 1))
+            right, bottom = np.clip(points.max(axis=0) + 1, 0, (width, height))
+            self.cache[key] = (int(left), int(top), int(right), int(bottom))
+        return self.cache[key]
+
+    def contains(self, box, width, height):
+        """Check whether the centre of a (top, right, bottom, left) box is inside the ROI."""
+        top, right, bottom, left = box
+        centre = ((left + right) / 2.0, (top + bottom) / 2.0)
+        return any(cv2.pointPolygonTest(polygon, centre, False) >= 0
+                   for polygon in self.pixel_polygons(width, height))
+
+
+class MotionGate:
+    """Cheap motion detector used to skip face detection while nothing moves.
+
+    Each frame is shrunk to a tiny blurred grayscale image and compared with
+    a running-average background.  Motion is reported when more than
+    ``min_area`` of the (ROI) pixels changed by more than ``threshold``, and
+    for ``hold_time`` seconds afterwards so a person pausing in the doorway is
+    still looked at.
+    """
+
+    def __init__(self, roi=None, width=96, threshold=25, min_area=0.01, learning_rate=0.05, hold_time=1.0):
+        self.roi = roi
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.learning_rate = learning_rate
+        self.hold_time = hold_time
+        self.background = None
+        self.last_motion = 0
+
+    def check(self, frame):
+        """Update the background with a frame and return whether there is motion."""
+        height, width = frame.shape[:2]
+        tiny_size = (self.width, max(1, int(height * self.width / width)))
+        tiny = cv2.resize(frame, tiny_size, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(tiny, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            self.last_motion = time.time()
+            return True
+
+        changed = cv2.absdiff(gray, cv2.convertScaleAbs(self.background)) > self.threshold
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+
+        if self.roi is not None:
+            inside = self.roi.mask(*tiny_size) > 0
+            moving = changed[inside].mean() > self.min_area if inside.any() else False
+        else:
+            moving = changed.mean() > self.min_area
+
+        now = time.time()
+        if moving:
+            self.last_motion = now
+        return moving or now - self.last_motion < self.hold_time
+
+
+class AdaptiveDetectionController:
+    """Adjust detection cost to hold a target recognition frame rate.
+
+    Settings form a ladder from most thorough to cheapest, each a
+    (downscale factor, times to upsample, detection stride) triple.  The
+    controller keeps a moving average of the per-frame detection cost
+    (detection time divided by stride) and, after ``patience`` detections,
+    steps down the ladder when it exceeds the frame budget (1 / target_fps)
+    or back up when it uses less than half of it.
+    """
+
+    LEVELS = [
+        (0.5, 1, 1),
+        (0.33, 1, 1),
+        (0.25, 1, 1),
+        (0.33, 0, 1),
+        (0.25, 0, 1),
+        (0.25, 0, 2),
+        (0.2, 0, 2),
+        (0.2, 0, 3),
+        (0.15, 0, 4),
+    ]
+
+    def __init__(self, target_fps=10.0, level=2, patience=5, smoothing=0.3):
+        self.budget = 1.0 / target_fps
+        self.level = level
+        self.patience = patience
+        self.smoothing = smoothing
+        self.average = None
+        self.samples = 0
+        self.ticks = deque(maxlen=30)
+
+    @property
+    def scale(self):
+        return self.LEVELS[self.level][0]
+
+    @property
+    def upsample(self):
+        return self.LEVELS[self.level][1]
+
+    @property
+    def stride(self):
+        return self.LEVELS[self.level][2]
+
+    def tick(self):
+        """Note that a frame was analyzed (for the achieved frame rate)."""
+        self.ticks.append(time.perf_counter())
+
+    def fps(self):
+        """Achieved analysis frame rate over the last few frames."""
+        if len(self.ticks) < 2:
+            return 0.0
+        return (len(self.ticks) - 1) / max(self.ticks[-1] - self.ticks[0], 1e-9)
+
+    def observe(self, seconds):
+        """Feed the duration of one detection and move along the ladder if needed."""
+        cost = seconds / self.stride
+        self.average = cost if self.average is None else self.average + self.smoothing * (cost - self.average)
+        self.samples += 1
+        if self.samples < self.patience:
+            return
+
+        if self.average > self.budget * 1.15 and self.level < len(self.LEVELS) - 1:
+            self.level += 1
+        elif self.average < self.budget * 0.5 and self.level > 0:
+            self.level -= 1
+        else:
+            return
+
+        # Start measuring the new setting from scratch
+        self.average = None
+        self.samples = 0
+
+    def describe(self):
+        """Short description of the current settings for the overlay."""
+        return f"scale {self.scale:.2f} up {self.upsample} stride {self.stride}"
+
+
+class FrameAnalyzer:
+    """Detect, encode and match the faces in a single frame.
+
+    The optional tracker, controller, motion gate and ROI decide when and where
+    detection runs; detection and encoding go to the executor if there is one.
+    """
+
+    def __init__(self, system, scale=0.25, stats=None, tracker=None, detect_interval=3, executor=None,
+                 controller=None, motion_gate=None, roi=None):
+        self.system = system
+        self.scale = scale
+        self.stats = stats or PipelineStats()
+        self.tracker = tracker
+        self.detect_interval = detect_interval
+        self.executor = executor
+        self.controller = controller
+        self.motion_gate = motion_gate
+        self.roi = roi
+        self.frame_index = 0
+        self.last_faces = []
+        self.detect_seconds = 0.0
+
+    def run(self, function, *args):
+        """Call function in the executor if there is one, otherwise inline."""
+        if self.executor is None:
+            return function(*args)
+        return self.executor.submit(function, *args).result()
+
+    def analyze(self, frame):
+        """Return a FaceResult for every face found in a BGR frame."""
+        self.frame_index += 1
+
+        # The motion check runs on every frame so its background model stays current
+        moving = True
+        if self.motion_gate is not None:
+            start = time.perf_counter()
+            moving = self.motion_gate.check(frame)
+            self.stats.record("motion", time.perf_counter() - start)
+            if not moving:
+                self.stats.increment("motion_skipped")
+
+        stride = 1
+        if self.controller is not None:
+            # Frames skipped by the motion gate don't count towards the analysis rate
+            if moving:
+                self.controller.tick()
+            stride = self.controller.stride
+            self.stats.set_gauge("recognition_fps", self.controller.fps())
+
+        tracking = self.tracker is not None and self.tracker.tracks
+        interval = self.detect_interval * stride if tracking else stride
+        if self.frame_index % interval or not moving:
+            if not tracking:
+                return self.last_faces
+            # Between detections just carry the tracked faces forward
+            start = time.perf_counter()
+            faces = self.tracker.predict(frame)
+            self.stats.record("track", time.perf_counter() - start)
+            return faces
+
+        self.last_faces = self.detect(frame)
+        if self.controller is not None:
+            # Only the detector's own time: encoding cost depends on the faces, not the settings
+            self.controller.observe(self.detect_seconds)
+            self.stats.set_gauge("detect_settings", self.controller.describe())
+        return self.last_faces
+
+    def detect(self, frame):
+        """Run full detection on a frame, then encode and match the faces that need it."""
+        scale, upsample = self.scale, 1
+        if self.controller is not None:
+            scale, upsample = self.controller.scale, self.controller.upsample
+
+        # Only look at the part of the frame covered by the ROI
+        height, width = frame.shape[:2]
+        left, top, right, bottom = self.roi.bounds(width, height) if self.roi is not None else (0, 0, width, height)
+        region = frame[top:bottom, left:right]
+
+        start = time.perf_counter()
+        # Resize frame for faster processing
+        small_frame = cv2.resize(region, (0, 0), fx=scale, fy=scale)
+        rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        self.stats.record("resize", time.perf_counter() - start)
+
+        # Find faces
+        start = time.perf_counter()
+        face_locations = self.run(detect_faces, rgb_small_frame, upsample)
+        self.detect_seconds = time.perf_counter() - start
+        self.stats.record("detect", self.detect_seconds)
+
+        # Scale back face locations into full-frame coordinates
+        boxes = [(int(round(t / scale)) + top, int(round(r / scale)) + left,
+                  int(round(b / scale)) + top, int(round(l / scale)) + left) for t, r, b, l in face_locations]
+        if self.roi is not None:
+            inside = [i for i, box in enumerate(boxes) if self.roi.contains(box, width, height)]
+            face_locations = [face_locations[i] for i in inside]
+            boxes = [boxes[i] for i in inside]
+
+        if self.tracker is None:
+            tracks = [FaceTrack(None, box) for box in boxes]
+            pending = list(range(len(tracks)))
+        else:
+            tracks = self.tracker.associate(boxes, frame)
+            pending = [i for i, track in enumerate(tracks) if self.tracker.needs_encoding(track)]
+            self.stats.increment("encodes_skipped", len(tracks) - len(pending))
+        if not tracks:
+            return []
+
+        if pending:
+            start = time.perf_counter()
+            face_encodings = self.run(encode_faces, rgb_small_frame, [face_locations[i] for i in pending])
+            self.stats.record("encode", time.perf_counter() - start)
+
+            # Match every face that needs it against the gallery in one batch
+            start = time.perf_counter()
+            matches = self.system.matcher.match(face_encodings)
+            self.stats.record("match", time.perf_counter() - start)
+            self.stats.increment("faces_processed", len(pending))
+
+            detection_index = self.tracker.detections if self.tracker is not None else 0
+            for i, match in zip(pending, matches):
+                tracks[i].identify(match, detection_index)
+
+        return [track.result() for track in tracks]
+
+
+class ArrivalIndex:
+    """Day-keyed index of the students who have arrived, shared by every camera.
+
+    For each day it maps a roll number to the time the student was last
+    seen, so deciding whether an arrival is a duplicate is one dictionary
+    lookup.  A student is logged once per day, or again after being away
+    (not seen) for ``reentry_window`` seconds if that is set.  It is filled
+    from the log store at start-up, so restarting does not log everyone
+    again, and a new day simply starts a new, empty entry.
+    """
+
+    def __init__(self, reentry_window=None, max_days=7):
+        self.reentry_window = reentry_window
+        self.max_days = max_days
+        self.days = {}
+        self.lock = threading.Lock()
+
+    def load(self, date_str, arrivals, seen_at=None):
+        """Add (roll_no, "HH:MM:SS") arrivals already logged on date_str.
+
+        The log only holds when a student was logged, not when they were last
+        seen, so with seen_at (the start-up time) every loaded student counts
+        as seen then: someone still in the room is not re-logged after a
+        restart, and the re-entry window runs from start-up.
+        """
+        with self.lock:
+            day = self.days.setdefault(date_str, {})
+            for name, time_str in arrivals:
+                seen = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M:%S")
+                if seen_at is not None:
+                    seen = max(seen, seen_at)
+                if name not in day or seen > day[name]:
+                    day[name] = seen
+
+    def claim(self, name, timestamp):
+        """Record a sighting of name at timestamp; return True if it should be logged as an arrival."""
+        date_str = timestamp.strftime("%Y-%m-%d")
+        with self.lock:
+            day = self.days.get(date_str)
+            if day is None:
+                day = self.days[date_str] = {}
+                # Only a few recent days are kept (batch runs may go back in time)
+                for old in sorted(self.days)[:-self.max_days]:
+                    del self.days[old]
+
+            last_seen = day.get(name)
+            if last_seen is None:
+                day[name] = timestamp
+                return True
+            if timestamp > last_seen:
+                day[name] = timestamp
+                away = (timestamp - last_seen).total_seconds()
+                return self.reentry_window is not None and away >= self.reentry_window
+            return False
+
+    def has_day(self, date_str):
+        """Check whether date_str has an entry (loaded, or with arrivals claimed)."""
+        with self.lock:
+            return date_str in self.days
+
+    def present(self, name):
+        """Check whether name has already arrived today."""
+        return name in self.days.get(datetime.now().strftime("%Y-%m-%d"), ())
+
+    def clear(self):
+        with self.lock:
+            self.days.clear()
+
+
+class AttendanceTracker:
+    """Decide which recognized faces become arrival or intruder log entries.
+
+    Whether a student's arrival is new is decided by the system's
+    ArrivalIndex (once per day, or again after a re-entry window), which all
+    cameras share and which survives restarts; the first intruder of the
+    session is saved, or with intruder_interval the first one in every that
+    many seconds.  After any logged event recognition pauses for
+    cooldown_duration seconds.  ``counts`` holds the number of arrivals and
+    intruders logged so far.
+    """
+
+    def __init__(self, system, cooldown_duration=2, on_event=None, intruder_interval=None, camera=None):
+        self.system = system
+        self.camera = camera
+        self.cooldown_duration = cooldown_duration
+        self.on_event = on_event or (lambda message: None)
+        self.intruder_interval = intruder_interval
+        self.counts = {"arrivals": 0, "intruders": 0}
+        self.last_intruder_time = None
+        self.cooldown_end_time = 0
+
+    def in_cooldown(self, now):
+        """Check whether recognition is paused after a recent event."""
+        return now < self.cooldown_end_time
+
+    def intruder_allowed(self, now):
+        """Check whether an intruder seen at now should be saved."""
+        if self.last_intruder_time is None:
+            return True
+        # Batch inputs are not in one time order, hence abs()
+        return self.intruder_interval is not None and abs(now - self.last_intruder_time) >= self.intruder_interval
+
+    def handle(self, frame, faces, now):
+        """Log arrivals and intruders for the faces recognized in a frame.
+
+        now is the frame's time in seconds since the epoch; it is also the
+        time written to the logs.
+        """
+        for face in faces:
+            if face.is_known:
+                # Already present students are just drawn, not logged again
+                timestamp = datetime.fromtimestamp(now)
+                if self.system.arrival_index.claim(face.name, timestamp):
+                    self.system.log_arrival(face.name, timestamp)
+                    self.counts["arrivals"] += 1
+                    self.on_event(f"Welcome {face.name}!")
+                    self.cooldown_end_time = now + self.cooldown_duration
+            elif self.intruder_allowed(now):
+                # Save intruder image once per session (or per interval)
+                self.system.save_intruder_image(frame, datetime.fromtimestamp(now), face.box, self.camera)
+                self.last_intruder_time = now
+                self.counts["intruders"] += 1
+                self.on_event("⚠️ Intruder detected!")
+                self.cooldown_end_time = now + self.cooldown_duration
+
+
+class RecognitionPipeline:
+    """Capture, recognition and display decoupled into stages for one camera.
+
+    A FrameSource thread keeps the latest frame, a recognition thread analyzes
+    the newest frame whenever it is free (dropping the ones it missed), and the
+    display reads ``latest_result`` to draw the most recent faces over every
+    captured frame.
+    """
+
+    def __init__(self, system, source=0, on_event=None, scale=0.25, cooldown_duration=2,
+                 tracking=True, detect_interval=3, optical_flow=False, executor=None, name=None, target_fps=10.0,
+                 motion_gating=True, roi=None):
+        self.name = name if name is not None else str(source)
+        self.stats = PipelineStats()
+        self.capture = FrameSource(source, self.stats)
+        tracker = FaceTracker(use_optical_flow=optical_flow,
+                              is_present=system.arrival_index.present) if tracking else None
+        controller = AdaptiveDetectionController(target_fps) if target_fps else None
+        motion_gate = MotionGate(roi) if motion_gating else None
+        self.analyzer = FrameAnalyzer(system, scale, self.stats, tracker, detect_interval, executor, controller,
+                                      motion_gate, roi)
+        self.attendance = AttendanceTracker(system, cooldown_duration, on_event, camera=self.name)
+        self.latest_result = RecognitionResult(-1, [], False, 0)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start capture and recognition; return False if the source could not be opened."""
+        if not self.capture.start():
+            return False
+
+        self.running = True
+        self.thread = threading.Thread(target=self.recognition_loop)
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop all stages."""
+        self.running = False
+        self.capture.stop()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+
+    def recognition_loop(self):
+        """Analyze the newest frame whenever the previous one is done."""
+        last_seq = -1
+        while self.running:
+            item = self.capture.read_latest(after_seq=last_seq, timeout=0.5)
+            if item is None:
+                if not self.capture.running:
+                    break
+                continue
+
+            seq, frame, timestamp = item
+            if last_seq >= 0 and seq > last_seq + 1:
+                self.stats.increment("recognition_dropped", seq - last_seq - 1)
+            last_seq = seq
+
+            now = time.time()
+            if self.attendance.in_cooldown(now):
+                self.latest_result = RecognitionResult(seq, [], True, timestamp)
+                continue
+
+            start = time.perf_counter()
+            try:
+                faces = self.analyzer.analyze(frame)
+                self.attendance.handle(frame, faces, now)
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+                faces = []
+            self.latest_result = RecognitionResult(seq, faces, False, timestamp)
+
+            self.stats.record("recognize", time.perf_counter() - start)
+            self.stats.set_gauge("recognition_backlog", self.capture.seq - seq)
+
+
+class BatchProcessor:
+    """Headless recognition over recorded video files or directories of images.
+
+    Frames are read as fast as possible (every ``stride``-th frame), resized in
+    this process and sent to a process pool for detection and encoding, with a
+    bounded number in flight.  Results are consumed in frame order, matched
+    against the gallery and passed to the same AttendanceTracker and logging
+    code used by the live GUI, stamped with the recording time.  The arrivals
+    already logged on each recording's date are loaded first, so back-filling
+    a day twice logs nobody twice.
+    """
+
+    IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+    VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.m4v', '.mpg', '.mpeg', '.wmv')
+
+    def __init__(self, system, stride=1, scale=0.25, workers=None, start_time=None, cooldown_duration=2,
+                 intruder_interval=300):
+        self.system = system
+        self.stride = max(1, stride)
+        self.scale = scale
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.start_time = start_time
+        self.attendance = AttendanceTracker(system, cooldown_duration, intruder_interval=intruder_interval)
+
+    def run(self, path):
+        """Process a video file, an image directory, or a directory of videos."""
+        start = time.perf_counter()
+        processed = 0
+        for frames in self.inputs(path):
+            processed += self.process(frames)
+
+        elapsed = time.perf_counter() - start
+        print(f"Processed {processed} frames in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.1f} frames/s): "
+              f"{self.attendance.counts['arrivals']} arrivals, {self.attendance.counts['intruders']} intruders")
+
+    @classmethod
+    def video_paths(cls, path):
+        """Return the video files at path (path itself if it is a file)."""
+        if os.path.isfile(path):
+            return [path]
+        return [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.lower().endswith(cls.VIDEO_EXTENSIONS)]
+
+    def inputs(self, path):
+        """Yield one frame iterator per input found at path."""
+        if not os.path.isfile(path):
+            images = [os.path.join(path, f) for f in sorted(os.listdir(path))
+                      if f.lower().endswith(self.IMAGE_EXTENSIONS)]
+            if images:
+                yield self.image_frames(images)
+        for video_path in self.video_paths(path):
+            yield self.video_frames(video_path)
+
+    def video_frames(self, video_path):
+        """Yield (time, frame) for every stride-th frame of a video.
+
+        Times count from --start-time if given (a single video only), otherwise
+        from the file's modification time minus its duration (when the
+        recording started).
+        """
+        video_capture = cv2.VideoCapture(video_path)
+        if not video_capture.isOpened():
+            print(f"Error opening video: {video_path}")
+            return
+
+        fps = video_capture.get(cv2.CAP_PROP_FPS) or 25.0
+        if self.start_time is not None:
+            base_time = self.start_time.timestamp()
+        else:
+            frame_count = video_capture.get(cv2.CAP_PROP_FRAME_COUNT) or 0
+            base_time = os.path.getmtime(video_path) - frame_count / fps
+        print(f"Processing video: {video_path}")
+
+        index = 0
+        try:
+            while True:
+                # grab() skips decoding of frames we are not going to use
+                if not video_capture.grab():
+                    break
+                if index % self.stride == 0:
+                    ret, frame = video_capture.retrieve()
+                    if ret:
+                        yield base_time + index / fps, frame
+                index += 1
+        finally:
+            video_capture.release()
+
+    def image_frames(self, image_paths):
+        """Yield (time, frame) for every stride-th image, timed by file modification time."""
+        print(f"Processing {len(image_paths)} images")
+        for image_path in image_paths[::self.stride]:
+            frame = cv2.imread(image_path)
+            if frame is None:
+                print(f"Error reading image: {image_path}")
+                continue
+            yield os.path.getmtime(image_path), frame
+
+    def process(self, frames):
+        """Run recognition over (time, frame) pairs; return how many frames were processed."""
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=SPAWN) if self.workers > 0 else None
+        in_flight = deque()
+        processed = 0
+        try:
+            for timestamp, frame in frames:
+                small_frame = cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale)
+                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+                if executor is None:
+                    self.handle_result(timestamp, frame, detect_and_encode_faces(rgb_small_frame))
+                    processed += 1
+                    continue
+
+                in_flight.append((timestamp, frame, executor.submit(detect_and_encode_faces, rgb_small_frame)))
+                # Keep every worker busy without buffering the whole video in memory
+                while len(in_flight) >= self.workers * 2:
+                    self.handle_result(*self.pop_result(in_flight))
+                    processed += 1
+
+            while in_flight:
+                self.handle_result(*self.pop_result(in_flight))
+                processed += 1
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        return processed
+
+    @staticmethod
+    def pop_result(in_flight):
+        """Take the oldest submitted frame and wait for its result."""
+        timestamp, frame, future = in_flight.popleft()
+        return timestamp, frame, future.result()
+
+    def handle_result(self, timestamp, frame, result):
+        """Match the faces found in one frame and log arrivals/intruders."""
+        face_locations, face_encodings = result
+        if not face_locations:
+            return
+
+        date_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+        if not self.system.arrival_index.has_day(date_str):
+            self.system.load_arrivals_on(date_str)
+
+        faces = []
+        for location, match in zip(face_locations, self.system.matcher.match(face_encodings)):
+            box = tuple(int(round(value / self.scale)) for value in location)
+            if match.is_match:
+                faces.append(FaceResult(box, match.name, (1 - match.distance) * 100, True))
+            else:
+                faces.append(FaceResult(box, "Unknown", 0, False))
+        self.attendance.handle(frame, faces, timestamp)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Facial recognition attendance system")
+    parser.add_argument("--source", action="append", type=parse_source,
+                        help="Camera index, RTSP URL or video file; repeat to monitor several cameras")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Detection/encoding worker processes (default: CPU count with several cameras "
+                             "or in headless mode, 0 = run in-process)")
+    parser.add_argument("--enroll-workers", type=int, default=None,
+                        help="Processes used to encode known faces (default: CPU count; headless mode "
+                             "defaults to --workers)")
+    parser.add_argument("--watch-interval", type=float, default=5.0,
+                        help="Seconds between checks of known_faces/ for added or changed images (0 = off)")
+    parser.add_argument("--target-fps", type=float, default=10.0,
+                        help="Recognition frame rate to aim for by adapting detection scale, upsampling and "
+                             "stride (0 = fixed 1/4 scale)")
+    parser.add_argument("--roi", action="append", type=RegionOfInterest.parse, metavar='"X,Y X,Y X,Y ..."',
+                        help="Only detect faces inside this polygon, in fractions of the frame size "
+                             "(e.g. \"0.3,0 0.7,0 0.7,1 0.3,1\"); repeat for several polygons")
+    parser.add_argument("--no-motion-gate", action="store_true",
+                        help="Run face detection even when nothing in the picture moves")
+    parser.add_argument("--render-fps", type=float, default=30.0,
+                        help="Maximum frame rate of the video display (0 = as fast as the GUI allows)")
+    parser.add_argument("--stats-interval", type=float, default=0,
+                        help="Append per-stage performance stats to logs/performance_stats.* every this many "
+                             "seconds (0 = off)")
+    parser.add_argument("--stats-format", choices=["csv", "json"], default="csv",
+                        help="Format of the performance stats file (json = one JSON object per line)")
+    parser.add_argument("--log-backend", choices=["csv", "sqlite"], default="csv",
+                        help="Store arrivals and intruders in CSV files or in logs/attendance.db "
+                             "(existing CSV logs are imported the first time)")
+    parser.add_argument("--reentry-minutes", type=float, default=None,
+                        help="Log a student again after not being seen for this many minutes "
+                             "(default: once per day)")
+    parser.add_argument("--matcher", choices=["exact", "ivf"], default="exact",
+                        help="Match faces exactly, or through an IVF index (faster for very large galleries)")
+    parser.add_argument("--ivf-nprobe", type=int, default=8,
+                        help="IVF cells searched per face; higher is slower with better recall")
+    parser.add_argument("--gallery-precision", choices=["float32", "float16", "int8"], default="float32",
+                        help="Keep known faces in memory at this precision; float16/int8 matches on the compact "
+                             "form and re-ranks the closest candidates from the full-precision cache")
+    parser.add_argument("--export-logs", metavar="DIR",
+                        help="SQLite backend: write the stored events to CSV files in DIR, then exit")
+    parser.add_argument("--report", choices=["today", "month"],
+                        help="SQLite backend: print today's arrivals and intruders, or the first arrival "
+                             "per student and day this month, then exit")
+    parser.add_argument("--headless", metavar="PATH",
+                        help="Process a video file or a directory of images/videos without a display, then exit")
+    parser.add_argument("--stride", type=int, default=1, help="Headless: process every Nth frame")
+    parser.add_argument("--scale", type=float, default=0.25, help="Headless: detection downscale factor")
+    parser.add_argument("--start-time", type=lambda text: datetime.strptime(text, "%Y-%m-%d %H:%M:%S"),
+                        help='Headless: wall-clock time of the first frame of a single video, '
+                             '"YYYY-MM-DD HH:MM:SS" (default: file modification time minus duration)')
+    parser.add_argument("--intruder-interval", type=float, default=300,
+                        help="Headless: save at most one intruder per this many seconds of recording")
+    parser.add_argument("--snapshot-mode", choices=["full", "crop"], default="full",
+                        help="Intruder snapshots: full frame, or face crop plus a downscaled context frame")
+    parser.add_argument("--snapshot-quality", type=int, default=90, help="Intruder snapshot JPEG quality (0-100)")
+    parser.add_argument("--intruder-quota-mb", type=float, default=None,
+                        help="Delete the oldest intruder snapshots beyond this many megabytes")
+    parser.add_argument("--intruder-retention-days", type=float, default=None,
+                        help="Delete intruder snapshots older than this many days")
+    args = parser.parse_args()
+
+    system_options = {
+        "snapshot_mode": args.snapshot_mode,
+        "snapshot_quality": args.snapshot_quality,
+        "intruder_quota_mb": args.intruder_quota_mb,
+        "intruder_retention_days": args.intruder_retention_days,
+        "log_backend": args.log_backend,
+        "enroll_workers": args.enroll_workers,
+        "matcher_type": args.matcher,
+        "ivf_nprobe": args.ivf_nprobe,
+        "reentry_minutes": args.reentry_minutes,
+        "gallery_precision": args.gallery_precision,
+    }
+
+    if args.matcher == "ivf" and args.gallery_precision != "float32":
+        parser.error("--gallery-precision float16/int8 cannot be combined with --matcher ivf")
+
+    if args.export_logs or args.report:
+        if args.log_backend != "sqlite":
+            parser.error("--export-logs and --report need --log-backend sqlite")
+        system = FacialRecognitionSystem(reset_logs=False, load_faces=False, **system_options)
+        store = system.event_store
+        today = datetime.now().strftime("%Y-%m-%d")
+        if args.export_logs:
+            os.makedirs(args.export_logs, exist_ok=True)
+            store.export_csv(os.path.join(args.export_logs, "arrival_logs.csv"),
+                             os.path.join(args.export_logs, "intruder_logs.csv"))
+            print(f"Exported event logs to {args.export_logs}")
+        if args.report == "today":
+            arrivals = store.arrivals_on(today)
+            print(f"Arrivals on {today}: {len(arrivals)}")
+            for roll_no, time_str in arrivals:
+                print(f"  {roll_no:<12} {time_str}")
+            intruders = store.intruders_on(today)
+            print(f"Intruders on {today}: {len(intruders)}")
+            for time_str, image_path in intruders:
+                print(f"  {time_str}  {image_path}")
+        elif args.report == "month":
+            print(f"First arrivals from {today[:8]}01 to {today}:")
+            for roll_no, date_str, time_str in store.first_arrivals(today[:8] + "01", today):
+                print(f"  {roll_no:<12} {date_str} {time_str}")
+        system.close()
+        raise SystemExit(0)
+
+    if args.headless:
+        if args.start_time and len(BatchProcessor.video_paths(args.headless)) > 1:
+            parser.error("--start-time can only be used with a single video")
+        if args.enroll_workers is None:
+            system_options["enroll_workers"] = args.workers
+        system = FacialRecognitionSystem(reset_logs=False, **system_options)
+        processor = BatchProcessor(system, stride=args.stride, scale=args.scale, workers=args.workers,
+                                   start_time=args.start_time, intruder_interval=args.intruder_interval)
+        processor.run(args.headless)
+        system.close()
+        raise SystemExit(0)
+
     # Create Tkinter root window
     root = tk.Tk()
 
     # Create the app
-    app = FacialRecognitionGUI(root)
+    app = FacialRecognitionGUI(root, sources=args.source, workers=args.workers, system_options=system_options,
+                               watch_interval=args.watch_interval, target_fps=args.target_fps,
+                               motion_gating=not args.no_motion_gate,
+                               roi=RegionOfInterest(args.roi) if args.roi else None, render_fps=args.render_fps,
+                               stats_interval=args.stats_interval, stats_format=args.stats_format)
 
     # Start the Tkinter event loop
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,497 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from Maincode import CompactFaceMatcher, FaceMatcher, FaceTracker, FacialRecognitionSystem, FrameAnalyzer, \
+    IVFFaceMatcher, MotionGate, PipelineStats
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def synthetic_gallery(count, seed=0):
+    """Generate a synthetic gallery of face encodings.
+
+    Identities are scattered around a few hundred group centres (faces are not
+    uniformly spread in encoding space) and scaled so that distances between
+    different people land around 0.8-1.0, like real 128-d face encodings.
+    """
+    rng = np.random.default_rng(seed)
+    groups = rng.normal(0, 0.06, (max(1, count // 200), 128))
+    members = rng.integers(0, len(groups), count)
+    return (groups[members] + rng.normal(0, 0.055, (count, 128))).astype(np.float32)
+
+
+def synthetic_queries(gallery, count, noise=0.03, seed=1):
+    """Generate queries as noisy copies of random gallery entries (another photo of the same person)."""
+    rng = np.random.default_rng(seed)
+    targets = rng.integers(0, len(gallery), count)
+    return gallery[targets] + rng.normal(0, noise, (count, 128)).astype(np.float32), targets
+
+
+def time_queries(matcher, queries, faces_per_frame):
+    """Return the mean latency in milliseconds of matching one frame's worth of faces."""
+    matcher.match(queries[:faces_per_frame])  # warm up
+    start = time.perf_counter()
+    results = []
+    for offset in range(0, len(queries), faces_per_frame):
+        results.extend(matcher.match(queries[offset:offset + faces_per_frame]))
+    elapsed = time.perf_counter() - start
+    frames = -(-len(queries) // faces_per_frame)
+    return elapsed / frames * 1000, results
+
+
+def benchmark_ann(sizes, nprobes, query_count, faces_per_frame):
+    """Compare IVF recall@1 and latency against exact search for each gallery size."""
+    rows = []
+    for size in sizes:
+        gallery = synthetic_gallery(size)
+        names = [str(i) for i in range(size)]
+        queries, _ = synthetic_queries(gallery, query_count)
+
+        exact = FaceMatcher(gallery, names)
+        exact_ms, exact_results = time_queries(exact, queries, faces_per_frame)
+        truth = np.array([result.index for result in exact_results])
+        rows.append({"size": size, "index": "exact", "nprobe": None, "build_s": 0.0,
+                     "recall_at_1": 1.0, "ms_per_frame": exact_ms})
+
+        for nprobe in nprobes:
+            start = time.perf_counter()
+            ivf = IVFFaceMatcher(gallery, names, nprobe=nprobe)
+            build_s = time.perf_counter() - start
+
+            ivf_ms, ivf_results = time_queries(ivf, queries, faces_per_frame)
+            found = np.array([result.index for result in ivf_results])
+            rows.append({"size": size, "index": f"ivf({ivf.n_lists})", "nprobe": nprobe, "build_s": build_s,
+                         "recall_at_1": float(np.mean(found == truth)), "ms_per_frame": ivf_ms})
+    return rows
+
+
+def max_rss_mb():
+    """Return the peak resident set size of this process in MB (None where unsupported)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_isolated(function, *args):
+    """Run function(*args) in a fresh process and return its result.
+
+    ru_maxrss is a peak over the whole life of a process, so cases that
+    report max_rss_mb each run in their own (spawned, not forked) process to
+    measure their own footprint rather than the largest one so far.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(function, *args).result()
+
+
+def traced_peak_mb(function, *args):
+    """Run function(*args) under tracemalloc and return (result, peak MB allocated).
+
+    Kept out of the timed sections because tracing slows allocations down.
+    """
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        return result, tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+@contextlib.contextmanager
+def scratch_directory():
+    """Run the block quietly in a fresh temporary working directory (the system uses relative paths)."""
+    previous = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="facebench_")
+    os.chdir(directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield directory
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def benchmark_match(sizes, query_count, faces_per_frame):
+    """Exact matching latency and matcher memory for galleries of each size."""
+    rows = []
+    for size in sizes:
+        gallery = synthetic_gallery(size)
+        names = [str(i) for i in range(size)]
+        queries, _ = synthetic_queries(gallery, query_count)
+
+        matcher, alloc_mb = traced_peak_mb(FaceMatcher, gallery, names)
+        ms_per_frame, _ = time_queries(matcher, queries, faces_per_frame)
+        rows.append({"size": size, "faces_per_frame": faces_per_frame, "ms_per_frame": ms_per_frame,
+                     "us_per_face": ms_per_frame * 1000 / faces_per_frame, "alloc_mb": alloc_mb})
+    return rows
+
+
+def exact_nearest(gallery, queries, chunk_size=4096):
+    """Return (index, distance) of every query's nearest gallery row, computed in float64."""
+    gallery = np.asarray(gallery, dtype=np.float64)
+    best = np.full(len(queries), np.inf)
+    index = np.zeros(len(queries), dtype=np.int64)
+    for query_number, query in enumerate(np.asarray(queries, dtype=np.float64)):
+        for start in range(0, len(gallery), chunk_size):
+            distances = np.linalg.norm(gallery[start:start + chunk_size] - query, axis=1)
+            nearest = int(np.argmin(distances))
+            if distances[nearest] < best[query_number]:
+                best[query_number], index[query_number] = distances[nearest], start + nearest
+    return index, best
+
+
+def benchmark_compact(sizes, precisions, query_count, faces_per_frame, noise, tolerance=0.6):
+    """Memory, latency and accuracy of compact galleries against float64 matching.
+
+    The float64 gallery is memory-mapped from a .npy file, as the encoding
+    cache is, so the compact matchers re-rank from disk-backed rows.  Query
+    noise defaults to putting many distances near the match tolerance, where
+    quantization could flip a decision.
+    """
+    rows = []
+    directory = tempfile.mkdtemp(prefix="facebench_")
+    try:
+        for size in sizes:
+            path = os.path.join(directory, f"gallery_{size}.npy")
+            np.save(path, synthetic_gallery(size).astype(np.float64))
+            gallery = np.load(path, mmap_mode='r')
+            names = [str(i) for i in range(size)]
+            queries, _ = synthetic_queries(np.asarray(gallery, dtype=np.float32), query_count, noise=noise)
+            truth, truth_distances = exact_nearest(gallery, queries)
+
+            for precision in precisions:
+                if precision == "float32":
+                    matcher = FaceMatcher(gallery, names, tolerance)
+                    float32_mb = matcher.nbytes / 1024 ** 2
+                else:
+                    matcher = CompactFaceMatcher(gallery, names, tolerance, precision=precision)
+                    float32_mb = matcher.float32_nbytes / 1024 ** 2
+                ms_per_frame, results = time_queries(matcher, queries, faces_per_frame)
+                found = np.array([result.index for result in results])
+                distances = np.array([result.distance for result in results])
+                decisions = np.array([result.is_match for result in results])
+                rows.append({"size": size, "precision": precision, "memory_mb": matcher.nbytes / 1024 ** 2,
+                             "saved_pct": 100 * (1 - matcher.nbytes / 1024 ** 2 / float32_mb),
+                             "recall_at_1": float(np.mean(found == truth)),
+                             "decisions_agree": float(np.mean(decisions == (truth_distances <= tolerance))),
+                             "max_distance_error": float(np.max(np.abs(distances - truth_distances))),
+                             "ms_per_frame": ms_per_frame})
+            del gallery
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return rows
+
+
+def synthetic_images(directory, count, seed=0):
+    """Write count distinct 640x480 JPEGs without faces, for timing decoding and detection alone."""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for index in range(count):
+        image = cv2.GaussianBlur(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8), (0, 0), 3)
+        path = os.path.join(directory, f"{index:06d}.jpg")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def fill_known_faces(directory, size, source_images):
+    """Fill directory with size images, cycling through source_images (one identity per file)."""
+    os.makedirs(directory, exist_ok=True)
+    for index in range(size):
+        source = source_images[index % len(source_images)]
+        shutil.copyfile(source, os.path.join(directory, f"{index:06d}{os.path.splitext(source)[1]}"))
+
+
+def benchmark_enroll(sizes, images_dir, workers):
+    """Cold (everything encoded) and warm (everything cached) enrollment time for each gallery size."""
+    sources_dir = tempfile.mkdtemp(prefix="facebench_src_")
+    try:
+        if images_dir:
+            source_images = sorted(os.path.abspath(os.path.join(images_dir, name)) for name in os.listdir(images_dir)
+                                   if name.lower().endswith(('.png', '.jpg', '.jpeg')))
+            if not source_images:
+                raise SystemExit(f"No images found in {images_dir}")
+        else:
+            source_images = synthetic_images(sources_dir, min(max(sizes), 50))
+
+        return [run_isolated(enroll_case, size, source_images, workers) for size in sizes]
+    finally:
+        shutil.rmtree(sources_dir, ignore_errors=True)
+
+
+def enroll_case(size, source_images, workers):
+    """Time a cold and a warm enrollment of size images; run through run_isolated()."""
+    with scratch_directory():
+        fill_known_faces("known_faces", size, source_images)
+
+        system = FacialRecognitionSystem(load_faces=False, enroll_workers=workers)
+        start = time.perf_counter()
+        system.load_known_faces()
+        cold_s = time.perf_counter() - start
+        faces = system.enrollment_summary.identities
+        system.close()
+
+        # A fresh system with the cache from the cold run, as on the next start-up
+        system = FacialRecognitionSystem(load_faces=False, enroll_workers=workers)
+        start = time.perf_counter()
+        system.load_known_faces()
+        warm_s = time.perf_counter() - start
+        system.close()
+
+    # Encoding worker processes are not included; this is the process holding the gallery
+    return {"size": size, "faces": faces, "cold_s": cold_s, "images_per_s": size / cold_s,
+            "warm_s": warm_s, "max_rss_mb": max_rss_mb()}
+
+
+def synthetic_frames(face_image, faces, count, width=1280, height=720, seed=0):
+    """Yield count frames with faces copies of face_image moving across a noisy background."""
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (0, 0), 5)
+    tile = cv2.resize(face_image, (200, 200)) if faces else None
+    for index in range(count):
+        frame = background.copy()
+        for face in range(faces):
+            # Faces drift slowly, like people walking past, so tracking and motion gating behave normally
+            x = (40 + face * 240 + index * 2) % (width - 200)
+            y = (height - 200) // 2 + int(40 * np.sin(index / 15.0 + face))
+            frame[y:y + 200, x:x + 200] = tile
+        yield frame
+
+
+def video_frames(path, count):
+    """Yield up to count frames of a recorded video."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise SystemExit(f"Could not open video {path}")
+    try:
+        for _ in range(count):
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+
+def run_pipeline(system, frames, scale, tracking, motion_gating):
+    """Analyze frames like a live camera's recognition thread; return (frames, seconds, stats)."""
+    stats = PipelineStats(window=100000)
+    analyzer = FrameAnalyzer(system, scale, stats, FaceTracker() if tracking else None,
+                             motion_gate=MotionGate(None) if motion_gating else None)
+    processed, elapsed = 0, 0.0
+    for frame in frames:
+        # Only analysis is timed; decoding or generating the input is not part of the pipeline cost
+        start = time.perf_counter()
+        analyzer.analyze(frame)
+        seconds = time.perf_counter() - start
+        stats.record("frame", seconds)
+        elapsed += seconds
+        processed += 1
+    return processed, elapsed, stats
+
+
+def benchmark_pipeline(face_counts, video, face_image_path, frame_count, gallery_size, scale, tracking,
+                       motion_gating):
+    """End-to-end frames/second of detection, tracking, encoding and matching."""
+    if video:
+        # Runs happen in a scratch working directory
+        cases = [("video", os.path.abspath(video), None, 0)]
+    else:
+        if face_image_path is not None:
+            face_image_path = os.path.abspath(face_image_path)
+        if (face_image_path is None or cv2.imread(face_image_path) is None) and any(face_counts):
+            print("No --face-image given (or it could not be read); only the 0-face run is possible")
+            face_counts = [0]
+        cases = [(str(faces), None, face_image_path, faces) for faces in face_counts]
+
+    return [run_isolated(pipeline_case, label, video_path, image_path, faces, frame_count, gallery_size, scale,
+                         tracking, motion_gating)
+            for label, video_path, image_path, faces in cases]
+
+
+def pipeline_case(label, video, face_image_path, faces, frame_count, gallery_size, scale, tracking, motion_gating):
+    """Measure one pipeline input (a video, or synthetic frames with faces faces); run through run_isolated()."""
+    if video:
+        frames = video_frames(video, frame_count)
+    else:
+        face_image = cv2.imread(face_image_path) if faces else None
+        frames = synthetic_frames(face_image, faces, frame_count)
+
+    gallery = synthetic_gallery(gallery_size)
+    with scratch_directory():
+        system = FacialRecognitionSystem(load_faces=False)
+        system.matcher = FaceMatcher(gallery, [str(i) for i in range(gallery_size)], system.tolerance)
+        processed, elapsed, stats = run_pipeline(system, frames, scale, tracking, motion_gating)
+        system.close()
+
+    percentiles = stats.percentiles_ms()
+    counters = stats.snapshot()["counters"]
+    return {"faces": label, "frames": processed, "fps": processed / max(elapsed, 1e-9),
+            "p50_ms": percentiles["frame"]["p50"], "p99_ms": percentiles["frame"]["p99"],
+            "detect_ms": percentiles.get("detect", {}).get("p50"),
+            "encode_ms": percentiles.get("encode", {}).get("p50"),
+            "faces_processed": counters.get("faces_processed", 0), "max_rss_mb": max_rss_mb()}
+
+
+# Per benchmark: the columns printed, the columns identifying a row across runs,
+# and the metrics compared by --compare (True when higher is better)
+BENCHMARKS = {
+    "ann": (["size", "index", "nprobe", "build_s", "recall_at_1", "ms_per_frame"], ["size", "index", "nprobe"],
+            {"recall_at_1": True, "ms_per_frame": False}),
+    "compact": (["size", "precision", "memory_mb", "saved_pct", "recall_at_1", "decisions_agree",
+                 "max_distance_error", "ms_per_frame"], ["size", "precision"],
+                {"recall_at_1": True, "decisions_agree": True, "ms_per_frame": False}),
+    "match": (["size", "faces_per_frame", "ms_per_frame", "us_per_face", "alloc_mb"],
+              ["size", "faces_per_frame"], {"ms_per_frame": False, "alloc_mb": False}),
+    "enroll": (["size", "faces", "cold_s", "images_per_s", "warm_s", "max_rss_mb"], ["size"],
+               {"cold_s": False, "warm_s": False}),
+    "pipeline": (["faces", "frames", "fps", "p50_ms", "p99_ms", "detect_ms", "encode_ms", "faces_processed",
+                  "max_rss_mb"], ["faces"], {"fps": True, "p99_ms": False}),
+}
+
+
+def compare_results(name, rows, baseline_path, tolerance):
+    """Print metrics that got worse than the baseline by more than tolerance; return how many did."""
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    if baseline.get("benchmark") != name:
+        raise SystemExit(f"{baseline_path} holds {baseline.get('benchmark')!r} results, not {name!r}")
+
+    _, keys, metrics = BENCHMARKS[name]
+    previous = {tuple(row.get(key) for key in keys): row for row in baseline["results"]}
+    changes = []
+    for row in rows:
+        old = previous.get(tuple(row.get(key) for key in keys))
+        if old is None:
+            continue
+        for metric, higher_is_better in metrics.items():
+            if not old.get(metric) or row.get(metric) is None:
+                continue
+            change = (row[metric] - old[metric]) / abs(old[metric])
+            worse = -change if higher_is_better else change
+            changes.append({**{key: row[key] for key in keys}, "metric": metric, "baseline": float(old[metric]),
+                            "current": float(row[metric]), "change_pct": change * 100,
+                            "status": "REGRESSION" if worse > tolerance else "ok"})
+
+    print(f"\nCompared with {baseline_path} ({baseline.get('host')}, {baseline.get('timestamp')}):")
+    if not changes:
+        print("no matching rows")
+        return 0
+    print_table(changes, keys + ["metric", "baseline", "current", "change_pct", "status"])
+    return sum(change["status"] == "REGRESSION" for change in changes)
+
+
+def print_table(rows, columns):
+    """Print result rows as a fixed-width table."""
+    def fmt(value):
+        if isinstance(value, float):
+            return f"{value:.4f}" if value < 10 else f"{value:.1f}"
+        return "-" if value is None else str(value)
+
+    widths = [max(len(column), *(len(fmt(row[column])) for row in rows)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    print("  ".join("-" * width for width in widths))
+    for row in rows:
+        print("  ".join(fmt(row[column]).ljust(width) for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the facial recognition system. All of them run "
+                                                 "offline on synthetic or recorded inputs, without a camera.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    ann = subparsers.add_parser("ann", help="IVF index recall and latency against exact matching")
+    ann.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ann.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16])
+    ann.add_argument("--queries", type=int, default=500)
+    ann.add_argument("--faces-per-frame", type=int, default=5)
+
+    match = subparsers.add_parser("match", help="Exact matching latency and memory against gallery size")
+    match.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000, 100000])
+    match.add_argument("--queries", type=int, default=500)
+    match.add_argument("--faces-per-frame", type=int, default=5)
+
+    compact = subparsers.add_parser("compact", help="Memory saved and accuracy change of float16/int8 galleries "
+                                                    "against float64 matching")
+    compact.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    compact.add_argument("--precision", nargs="+", default=["float32", "float16", "int8"],
+                         choices=["float32", "float16", "int8"])
+    compact.add_argument("--queries", type=int, default=500)
+    compact.add_argument("--faces-per-frame", type=int, default=5)
+    compact.add_argument("--noise", type=float, default=0.05,
+                         help="Query noise; 0.05 puts typical distances near the 0.6 tolerance")
+
+    enroll = subparsers.add_parser("enroll", help="Cold and cached enrollment time against gallery size")
+    enroll.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    enroll.add_argument("--images", help="Directory of face photos to enroll (cycled to reach each size); "
+                                         "default: synthetic images without faces, which only time decoding "
+                                         "and detection")
+    enroll.add_argument("--workers", type=int, default=None, help="Enrollment processes (default: CPU count)")
+
+    pipeline = subparsers.add_parser("pipeline", help="End-to-end recognition frames/second")
+    pipeline.add_argument("--faces", type=int, nargs="+", default=[0, 1, 5],
+                          help="Faces per synthetic frame, one run each")
+    pipeline.add_argument("--face-image", help="Photo of one face pasted into the synthetic frames "
+                                               "(required for runs with faces)")
+    pipeline.add_argument("--video", help="Use this recorded video instead of synthetic frames")
+    pipeline.add_argument("--frames", type=int, default=300)
+    pipeline.add_argument("--gallery-size", type=int, default=1000)
+    pipeline.add_argument("--scale", type=float, default=0.25)
+    pipeline.add_argument("--no-tracking", action="store_true")
+    pipeline.add_argument("--no-motion-gate", action="store_true")
+
+    for subparser in subparsers.choices.values():
+        subparser.add_argument("--json", help="Also save the results to this JSON file")
+        subparser.add_argument("--compare", metavar="BASELINE_JSON",
+                               help="Compare with results saved earlier by --json; exit with status 1 if "
+                                    "any metric regressed")
+        subparser.add_argument("--tolerance", type=float, default=0.10,
+                               help="Relative change counted as a regression by --compare (default 0.10)")
+
+    args = parser.parse_args()
+
+    if args.benchmark == "ann":
+        rows = benchmark_ann(args.sizes, args.nprobe, args.queries, args.faces_per_frame)
+    elif args.benchmark == "compact":
+        rows = benchmark_compact(args.sizes, args.precision, args.queries, args.faces_per_frame, args.noise)
+    elif args.benchmark == "match":
+        rows = benchmark_match(args.sizes, args.queries, args.faces_per_frame)
+    elif args.benchmark == "enroll":
+        rows = benchmark_enroll(args.sizes, args.images, args.workers)
+    else:
+        rows = benchmark_pipeline(args.faces, args.video, args.face_image, args.frames, args.gallery_size,
+                                  args.scale, not args.no_tracking, not args.no_motion_gate)
+    print_table(rows, BENCHMARKS[args.benchmark][0])
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({"benchmark": args.benchmark, "timestamp": datetime.now().isoformat(timespec="seconds"),
+                       "host": platform.node(), "python": platform.python_version(), "numpy": np.__version__,
+                       "cpu_count": os.cpu_count(), "arguments": vars(args), "results": rows}, file, indent=2)
+        print(f"Saved results to {args.json}")
+
+    if args.compare and compare_results(args.benchmark, rows, args.compare, args.tolerance):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("face_recognition")
+
+from Maincode import ArrivalIndex, FacialRecognitionSystem
+
+
+def test_claim_once_per_day():
+    index = ArrivalIndex()
+    now = datetime(2026, 10, 17, 8, 0, 0)
+    assert index.claim("S1", now)
+    assert not index.claim("S1", now + timedelta(hours=3))
+    assert index.claim("S1", now + timedelta(days=1))
+
+
+def test_claim_again_after_reentry_window():
+    index = ArrivalIndex(reentry_window=30 * 60)
+    now = datetime(2026, 10, 17, 8, 0, 0)
+    assert index.claim("S1", now)
+    assert not index.claim("S1", now + timedelta(minutes=20))
+    assert not index.claim("S1", now + timedelta(minutes=40))
+    assert index.claim("S1", now + timedelta(minutes=71))
+
+
+def test_loaded_arrivals_count_as_seen_at_startup():
+    index = ArrivalIndex(reentry_window=30 * 60)
+    startup = datetime(2026, 10, 17, 12, 0, 0)
+    index.load("2026-10-17", [("S1", "08:00:00")], seen_at=startup)
+    assert not index.claim("S1", startup + timedelta(minutes=5))
+    assert index.claim("S1", startup + timedelta(minutes=40))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def log_live_arrival_then_backfill(rows=5000):
+    system = FacialRecognitionSystem(load_faces=False)
+    system.log_arrival("LIVE1", datetime.now())
+    yesterday = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    for i in range(rows):
+        system.log_arrival(f"OLD{i}", yesterday + timedelta(seconds=i))
+    system.close()
+
+
+def test_restart_keeps_todays_arrivals_after_backfill(workdir):
+    log_live_arrival_then_backfill()
+
+    system = FacialRecognitionSystem(load_faces=False)
+    try:
+        assert system.arrival_index.present("LIVE1")
+        assert not system.arrival_index.claim("LIVE1", datetime.now())
+    finally:
+        system.close()
+
+
+def test_restart_without_log_metadata_scans_the_whole_log(workdir):
+    log_live_arrival_then_backfill()
+    (workdir / "logs" / "arrival_logs.meta.json").unlink()
+
+    system = FacialRecognitionSystem(load_faces=False)
+    try:
+        assert system.arrival_index.present("LIVE1")
+        assert system.log_counter == 5002
+    finally:
+        system.close()